@@ -0,0 +1,181 @@
+"""Страничный кэш с версионными ключами и защитой от «стада».
+
+Каждая лента имеет счётчик поколений в кэше. Запись в кэше хранит
+поколения ленты и общего поколения ALL, на которых она построена,
+поэтому запись в БД, меняющая ленту, устаревает одним incr, а срок
+хранения страниц можно держать часами.
+
+Устаревшую страницу пересчитывает только один процесс (блокировка
+через cache.add), остальные в это время получают устаревшую копию
+или ждут первую. Свежие записи с вероятностью, растущей к концу
+срока и со стоимостью пересчёта, обновляются заранее (XFetch).
+"""
+import functools
+import math
+import random
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (
+    get_cache_key, has_vary_header, learn_cache_key, patch_vary_headers,
+)
+from django.utils.http import quote_etag
+
+from . import metrics
+
+ALL = 'all'
+GENERATION_PREFIX = 'generation:'
+LOCK_PREFIX = 'lock:'
+WAIT_STEP = 0.05
+
+stats = Counter()
+
+
+def initial_generation():
+    # Потерянный счётчик начинается с нового значения, а не с 1:
+    # иначе записи старых поколений снова сочтутся свежими.
+    return int(time.time() * 1000)
+
+
+def generations(*names):
+    keys = [GENERATION_PREFIX + name for name in names]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, initial_generation(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(*names):
+    """Переводит ленты на новое поколение."""
+    for name in names:
+        key = GENERATION_PREFIX + name
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, initial_generation(), None)
+
+
+def should_cache(request, response):
+    if response.streaming or response.status_code != 200:
+        return False
+    if (not request.COOKIES and response.cookies
+            and has_vary_header(response, 'Cookie')):
+        return False
+    return 'private' not in response.get('Cache-Control', ())
+
+
+def is_fresh(entry, versions, now):
+    """Свежа ли запись с учётом вероятностного раннего обновления."""
+    if entry['versions'] != versions:
+        return False
+    early = (entry['delta'] * settings.CACHE_XFETCH_BETA
+             * -math.log(1 - random.random()))
+    if now + early < entry['expires']:
+        return True
+    if now < entry['expires']:
+        stats['early'] += 1
+    return False
+
+
+def wait_for(key, versions):
+    """Ждёт, пока другой процесс положит в кэш свежую страницу."""
+    deadline = time.monotonic() + settings.CACHE_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None and entry['versions'] == versions:
+            return entry
+    return None
+
+
+def count(result, feed):
+    stats[result] += 1
+    # Ленты групп и профилей считаются вместе, без slug и имени.
+    metrics.inc('yatube_page_cache_total',
+                feed=feed.split(':')[0], result=result)
+
+
+def cached_response(key, versions, feed):
+    """Запись, которую можно отдать из кэша, и взятая блокировка.
+
+    Без записи и без блокировки страницу нужно посчитать, не кэшируя.
+    """
+    entry = cache.get(key) if key is not None else None
+    if entry is not None and is_fresh(entry, versions, time.time()):
+        count('hit', feed)
+        return entry, None
+    if key is None:
+        return None, None
+    lock = LOCK_PREFIX + key
+    if cache.add(lock, 1, settings.CACHE_LOCK_TIMEOUT):
+        return None, lock
+    if entry is not None:
+        count('stale', feed)
+        return entry, None
+    entry = wait_for(key, versions)
+    if entry is not None:
+        count('wait', feed)
+        return entry, None
+    return None, None
+
+
+def cache_versioned(timeout, feed, etag=None):
+    """Кэширует ответ представления, привязывая его к поколению ленты.
+
+    feed получает именованные аргументы из URL и возвращает имя
+    ленты. В отличие от cache_page не выставляет Expires и max-age:
+    свежесть обеспечивает сброс поколения, а не браузерный кэш.
+
+    etag(request, versions) строит ETag по поколениям, на которых
+    построена отданная страница: устаревшая копия не должна получить
+    ETag свежей, иначе клиент будет получать на неё 304.
+    """
+    keep = timeout + settings.CACHE_STALE_TIME
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            name = feed(**kwargs)
+            prefix = f'feed.{name}'
+            versions = generations(ALL, name)
+            key = get_cache_key(request, prefix, 'GET', cache=cache)
+            entry, lock = cached_response(key, versions, name)
+            if entry is not None:
+                response = entry['response']
+                if etag is not None:
+                    response['ETag'] = quote_etag(
+                        etag(request, entry['versions']))
+                return response
+            count('miss', name)
+            try:
+                started = time.perf_counter()
+                response = view(request, *args, **kwargs)
+                session = getattr(request, 'session', None)
+                if session is not None and session.accessed:
+                    # SessionMiddleware добавит Vary: Cookie позже, чем
+                    # ключ будет вычислен, поэтому учитываем его заранее.
+                    patch_vary_headers(response, ('Cookie',))
+                if should_cache(request, response):
+                    delta = time.perf_counter() - started
+                    key = learn_cache_key(
+                        request, response, keep, prefix, cache=cache)
+                    cache.set(key, {
+                        'response': response,
+                        'versions': versions,
+                        'delta': delta,
+                        'expires': time.time() + timeout,
+                    }, keep)
+            finally:
+                if lock is not None:
+                    cache.delete(lock)
+            if etag is not None:
+                response['ETag'] = quote_etag(etag(request, versions))
+            return response
+        return wrapper
+    return decorator
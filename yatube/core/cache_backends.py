@@ -0,0 +1,268 @@
+"""Кэш в общем файле SQLite с локальным уровнем L1 в памяти процесса.
+
+LocMemCache у каждого воркера свой, поэтому страницы и ключи
+sorl-thumbnail считаются столько раз, сколько запущено воркеров.
+SQLiteCache хранит записи в одном файле на машине (WAL, поэтому
+читатели не блокируют писателя), вытесняет давно не читавшиеся
+записи при превышении MAX_ENTRIES и атомарно выполняет add/incr
+в транзакции BEGIN IMMEDIATE.
+
+Перед файлом стоит L1 — словарь в памяти процесса с коротким сроком
+L1_TIMEOUT. Собственные записи процесса сбрасывают его сразу, а
+изменения, сделанные другими процессами, видны не позже L1_TIMEOUT.
+Ключи с префиксами из L1_BYPASS (счётчики поколений, блокировки)
+всегда читаются из файла.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL,'
+    ' expires REAL, accessed REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+# Время последнего чтения обновляем не чаще раза в секунду на ключ,
+# чтобы чтения не превращались в запись на каждом обращении.
+ACCESS_GRANULARITY = 1.0
+FOREVER = float('inf')
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.l1_timeout = float(options.get('L1_TIMEOUT', 1))
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self.l1_bypass = tuple(options.get('L1_BYPASS', ()))
+        self.cull_every = int(options.get('CULL_EVERY', 100))
+        self._local = threading.local()
+        self._l1 = OrderedDict()
+        self._l1_lock = threading.Lock()
+        self._writes = 0
+
+    # Соединение и L1
+
+    @property
+    def connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # После fork соединение родителя использовать нельзя.
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            local.connection, local.pid = connection, os.getpid()
+            with self._l1_lock:
+                self._l1.clear()
+        return local.connection
+
+    def _l1_get(self, key, now):
+        with self._l1_lock:
+            item = self._l1.get(key)
+            if item is None:
+                return None
+            value, until = item
+            if until <= now:
+                del self._l1[key]
+                return None
+            return value
+
+    def _l1_set(self, key, value, now):
+        if self.l1_timeout <= 0:
+            return
+        with self._l1_lock:
+            self._l1[key] = (value, now + self.l1_timeout)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_forget(self, *keys):
+        with self._l1_lock:
+            for key in keys:
+                self._l1.pop(key, None)
+
+    def _expires(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        return FOREVER if expires is None else expires
+
+    def _touch_accessed(self, keys, now):
+        self.connection.executemany(
+            'UPDATE cache SET accessed = ? WHERE key = ? AND accessed < ?',
+            [(now, key, now - ACCESS_GRANULARITY) for key in keys],
+        )
+
+    # Чтение
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        now = time.time()
+        found = {}
+        missing = {}
+        for key in keys:
+            made = self.make_key(key, version=version)
+            self.validate_key(made)
+            value = None
+            if not key.startswith(self.l1_bypass):
+                value = self._l1_get(made, now)
+            if value is None:
+                missing[made] = key
+            else:
+                found[key] = pickle.loads(value)
+        if not missing:
+            return found
+        placeholders = ','.join('?' * len(missing))
+        rows = self.connection.execute(
+            f'SELECT key, value, expires FROM cache '
+            f'WHERE key IN ({placeholders})', list(missing),
+        ).fetchall()
+        alive = []
+        for made, value, expires in rows:
+            if expires is not None and expires <= now:
+                continue
+            alive.append(made)
+            if not missing[made].startswith(self.l1_bypass):
+                self._l1_set(made, value, now)
+            found[missing[made]] = pickle.loads(value)
+        if alive:
+            self._touch_accessed(alive, now)
+        return found
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    # Запись
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        expires = self._expires(timeout)
+        rows = []
+        for key, value in data.items():
+            made = self.make_key(key, version=version)
+            self.validate_key(made)
+            rows.append((made, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                         expires, now))
+        self._l1_forget(*(row[0] for row in rows))
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires, accessed)'
+                ' VALUES (?, ?, ?, ?)', rows)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        self._maybe_cull(len(rows))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        now = time.time()
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (made, now))
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires, accessed)'
+                ' VALUES (?, ?, ?, ?)',
+                (made, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 self._expires(timeout), now),
+            ).rowcount
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        if added:
+            self._l1_forget(made)
+            self._maybe_cull(1)
+        return bool(added)
+
+    def incr(self, key, delta=1, version=None):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        now = time.time()
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? AND expires > ?',
+                (made, now)).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ?, accessed = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now, made))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        self._l1_forget(made)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        return bool(self.connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND expires > ?',
+            (self._expires(timeout), made, time.time()),
+        ).rowcount)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        made = [self.make_key(key, version=version) for key in keys]
+        for key in made:
+            self.validate_key(key)
+        self._l1_forget(*made)
+        self.connection.executemany(
+            'DELETE FROM cache WHERE key = ?', [(key,) for key in made])
+
+    def clear(self):
+        with self._l1_lock:
+            self._l1.clear()
+        self.connection.execute('DELETE FROM cache')
+
+    # Вытеснение
+
+    def _maybe_cull(self, written):
+        self._writes += written
+        if self._writes < self.cull_every:
+            return
+        self._writes = 0
+        self.cull()
+
+    def cull(self):
+        """Удаляет просроченные записи и самые давно читанные сверх лимита."""
+        connection = self.connection
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        excess = count - self._max_entries
+        if self._cull_frequency:
+            excess = max(excess, count // self._cull_frequency)
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            ' SELECT key FROM cache ORDER BY accessed LIMIT ?)', (excess,))
@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache_backends import SQLiteCache
+
+PAYLOAD = 'x' * 2048
+
+# Бэкенд достаётся воркерам через fork: LocMemCache при этом у каждого
+# процесса свой, как у воркеров gunicorn.
+backend = None
+
+
+def make_backends(directory):
+    return {
+        'locmem': lambda: LocMemCache('benchmark', {
+            'OPTIONS': {'MAX_ENTRIES': 100000}}),
+        'sqlite': lambda: SQLiteCache(
+            os.path.join(directory, 'benchmark.sqlite3'),
+            {'OPTIONS': {'MAX_ENTRIES': 100000, 'L1_TIMEOUT': 1}}),
+    }
+
+
+def worker(args):
+    """Читает случайные ключи, при промахе «пересчитывает» и пишет."""
+    operations, keys, seed = args
+    random.seed(seed)
+    hits = 0
+    started = time.perf_counter()
+    for _ in range(operations):
+        key = f'key:{random.randrange(keys)}'
+        if backend.get(key) is None:
+            backend.set(key, PAYLOAD, 300)
+        else:
+            hits += 1
+    return hits, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает LocMemCache и SQLiteCache при нескольких '
+            'процессах: пропускную способность и долю попаданий')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--operations', type=int, default=5000)
+        parser.add_argument('--keys', type=int, default=500)
+
+    def handle(self, *args, **options):
+        global backend
+        processes = options['processes']
+        operations = options['operations']
+        context = multiprocessing.get_context('fork')
+        with tempfile.TemporaryDirectory() as directory:
+            for name, factory in make_backends(directory).items():
+                backend = factory()
+                backend.clear()
+                jobs = [(operations, options['keys'], seed)
+                        for seed in range(processes)]
+                started = time.perf_counter()
+                with context.Pool(processes) as pool:
+                    results = pool.map(worker, jobs)
+                elapsed = time.perf_counter() - started
+                hits = sum(hits for hits, _ in results)
+                total = operations * processes
+                self.stdout.write(
+                    f'{name:>7}: {processes} процессов, '
+                    f'{total / elapsed:,.0f} оп/с, '
+                    f'попаданий {hits / total:.1%}'
+                )
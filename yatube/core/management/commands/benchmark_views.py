@@ -0,0 +1,170 @@
+import json
+import math
+import subprocess
+import time
+import tracemalloc
+from statistics import median_low
+
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from posts.models import Group, Post, User
+
+NAMESPACES = ('posts', 'users')
+
+
+def percentile(values, percent):
+    """Значение по методу ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def routes(namespaces=NAMESPACES):
+    """(имя, параметры) всех адресов из urls.py приложений."""
+    for resolver in get_resolver().url_patterns:
+        if not isinstance(resolver, URLResolver):
+            continue
+        if resolver.namespace not in namespaces:
+            continue
+        for pattern in resolver.url_patterns:
+            yield (f'{resolver.namespace}:{pattern.name}',
+                   list(pattern.pattern.converters))
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку (p50/p95/p99), число запросов и пиковую '
+            'память каждого адреса posts и users на текущих данных')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='очищать кэш перед каждым запросом',
+        )
+        parser.add_argument('--output', help='файл для результатов в JSON')
+        parser.add_argument(
+            '--compare',
+            help='JSON прошлого прогона для сравнения p50',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('Нужен хотя бы один замер: --requests 1')
+        self.options = options
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as stream:
+                previous = json.load(stream)['routes']
+        self.fixtures = self.pick_fixtures()
+        results = {}
+        # Изменения данных (подписки, выход) откатываются после прогона.
+        with override_settings(DEBUG=False), transaction.atomic():
+            for name, params in routes():
+                results[name] = self.measure(name, params)
+                self.report(name, results[name], previous)
+            transaction.set_rollback(True)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                json.dump({
+                    'commit': current_commit(),
+                    'created': timezone.now().isoformat(),
+                    'requests': options['requests'],
+                    'cold': options['cold'],
+                    'posts': Post.objects.count(),
+                    'routes': results,
+                }, stream, ensure_ascii=False, indent=2)
+
+    def pick_fixtures(self):
+        """Самые тяжёлые объекты: у них больше всего строк на страницу."""
+        post = Post.objects.order_by('-comments_count').first()
+        group = Group.objects.order_by('-posts_count').first()
+        reader = User.objects.order_by('-stats__following_count').first()
+        if post is None or group is None or reader is None:
+            raise CommandError(
+                'Нужны посты и группы, например из generate_data')
+        author = User.objects.order_by('-stats__posts_count').first()
+        words = [word for word in post.text.split() if len(word) > 3]
+        return {
+            'reader': reader,
+            'post': post,
+            'query': {'posts:search': {'q': words[0] if words else 'а'}},
+            'kwargs': {
+                'post_id': post.pk,
+                'slug': group.slug,
+                'username': author.username,
+                'uidb64': urlsafe_base64_encode(force_bytes(reader.pk)),
+                'token': default_token_generator.make_token(reader),
+            },
+        }
+
+    def request(self, client, url, user, query=None):
+        """Один запрос: (секунды, число SQL-запросов, код ответа)."""
+        client.force_login(user)
+        if self.options['cold']:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(url, query)
+            elapsed = time.perf_counter() - started
+        return elapsed, len(queries), response.status_code
+
+    def measure(self, name, params):
+        url = reverse(name, kwargs={
+            param: self.fixtures['kwargs'][param] for param in params})
+        # Править пост может только автор.
+        user = (self.fixtures['post'].author if name == 'posts:post_edit'
+                else self.fixtures['reader'])
+        query = self.fixtures['query'].get(name)
+        client = Client()
+        for _ in range(self.options['warmup']):
+            self.request(client, url, user, query)
+        samples = [self.request(client, url, user, query)
+                   for _ in range(self.options['requests'])]
+        latencies = [elapsed * 1000 for elapsed, _, _ in samples]
+        tracemalloc.start()
+        try:
+            self.request(client, url, user, query)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {
+            'url': url,
+            'status': samples[-1][2],
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'queries': median_low(queries for _, queries, _ in samples),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def report(self, name, result, previous):
+        line = (f'{name:<32} {result["status"]} '
+                f'p50 {result["p50_ms"]:8.2f} мс  '
+                f'p95 {result["p95_ms"]:8.2f}  p99 {result["p99_ms"]:8.2f}  '
+                f'запросов {result["queries"]:>4}  '
+                f'память {result["peak_kb"]:8.1f} КБ')
+        before = (previous or {}).get(name)
+        if before and before['p50_ms']:
+            change = result['p50_ms'] / before['p50_ms'] - 1
+            line += f'  p50 {change:+.0%}'
+        self.stdout.write(line)
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from core.models import SlowQuery
+
+ORDERINGS = {
+    'total': F('total_ms').desc(),
+    'count': F('count').desc(),
+    'max': F('max_ms').desc(),
+    'avg': (F('total_ms') / F('count')).desc(),
+}
+
+
+class Command(BaseCommand):
+    help = 'Выводит самые тяжёлые запросы из журнала медленных запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument(
+            '--order',
+            choices=sorted(ORDERINGS),
+            default='total',
+            help='по суммарному, среднему, наибольшему времени или числу',
+        )
+        parser.add_argument(
+            '--plans',
+            action='store_true',
+            help='показывать планы запросов',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='очистить журнал',
+        )
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(
+                f'Журнал очищен, удалено записей: {deleted}'))
+            return
+        queries = SlowQuery.objects.filter(count__gt=0).order_by(
+            ORDERINGS[options['order']])[:options['limit']]
+        for rank, query in enumerate(queries, 1):
+            self.stdout.write(
+                f'{rank}. {query.total_ms:.0f} мс всего, '
+                f'{query.count} раз, в среднем '
+                f'{query.total_ms / query.count:.1f} мс, '
+                f'максимум {query.max_ms:.1f} мс, '
+                f'{query.view or "?"} [{query.fingerprint[:8]}]')
+            self.stdout.write(f'   {query.sql}')
+            if options['plans'] and query.plan:
+                for line in query.plan.splitlines():
+                    self.stdout.write(f'     {line}')
@@ -0,0 +1,193 @@
+"""Метрики приложения в текстовом формате Prometheus.
+
+Счётчики и гистограммы копятся в памяти процесса. Если задан
+METRICS_DB, процесс прибавляет накопленное к общему файлу SQLite
+(WAL, одна транзакция BEGIN IMMEDIATE на сброс) при очередной записи,
+если с прошлого сброса прошло METRICS_FLUSH_INTERVAL секунд, перед
+выдачей /metrics и при выходе. Тогда /metrics отдаёт сумму по всем
+воркерам WSGI и процессам генерации копий картинок. Без METRICS_DB
+каждый процесс отдаёт только свои числа.
+
+Гистограммы хранятся так, как их отдаёт Prometheus: накопленные
+корзины _bucket{le=...}, _sum и _count.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+
+Metric = namedtuple('Metric', 'kind help buckets')
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS = {
+    'yatube_http_requests_total': Metric(
+        'counter', 'HTTP-запросы по представлению, методу и коду ответа',
+        None),
+    'yatube_http_request_duration_seconds': Metric(
+        'histogram', 'Время ответа по представлению', SECONDS),
+    'yatube_db_queries_total': Metric(
+        'counter', 'SQL-запросы по представлению', None),
+    'yatube_cache_gets_total': Metric(
+        'counter', 'Чтения из кэша по результату', None),
+    'yatube_page_cache_total': Metric(
+        'counter', 'Обращения к страничному кэшу по ленте и результату',
+        None),
+    'yatube_thumbnail_duration_seconds': Metric(
+        'histogram', 'Время построения копий одной картинки',
+        (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)),
+    'yatube_upload_size_bytes': Metric(
+        'histogram', 'Размер загруженных картинок',
+        tuple(2 ** power for power in range(16, 26, 2))),
+}
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS metrics '
+    '(key TEXT PRIMARY KEY, value REAL NOT NULL)'
+)
+
+_lock = threading.Lock()
+_values = defaultdict(float)
+_flushed = time.monotonic()
+_local = threading.local()
+
+
+def sample_key(name, labels):
+    return name, tuple(sorted((key, str(value))
+                              for key, value in labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    with _lock:
+        _values[sample_key(name, labels)] += amount
+    maybe_flush()
+
+
+def observe(name, value, **labels):
+    """Кладёт значение в гистограмму name."""
+    with _lock:
+        # Пустые корзины тоже выводятся: Prometheus ждёт их все.
+        for bound in METRICS[name].buckets:
+            _values[sample_key(f'{name}_bucket',
+                               {**labels, 'le': bound})] += value <= bound
+        _values[sample_key(f'{name}_bucket', {**labels, 'le': '+Inf'})] += 1
+        _values[sample_key(f'{name}_sum', labels)] += value
+        _values[sample_key(f'{name}_count', labels)] += 1
+    maybe_flush()
+
+
+def connection():
+    owner = (os.getpid(), settings.METRICS_DB)
+    if getattr(_local, 'owner', None) != owner:
+        # После fork соединение родителя использовать нельзя.
+        db = sqlite3.connect(
+            settings.METRICS_DB, timeout=30, isolation_level=None)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute(SCHEMA)
+        _local.connection, _local.owner = db, owner
+    return _local.connection
+
+
+def maybe_flush():
+    if settings.METRICS_DB is None:
+        return
+    if time.monotonic() - _flushed >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def flush():
+    """Прибавляет накопленное процессом к общему файлу и обнуляет."""
+    global _values, _flushed
+    if settings.METRICS_DB is None:
+        return
+    with _lock:
+        values, _values = _values, defaultdict(float)
+        _flushed = time.monotonic()
+    if not values:
+        return
+    rows = [(json.dumps(key), value) for key, value in values.items()]
+    db = connection()
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        db.executemany(
+            'INSERT INTO metrics (key, value) VALUES (?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = value + excluded.value',
+            rows)
+        db.execute('COMMIT')
+    except Exception:
+        db.execute('ROLLBACK')
+        raise
+
+
+atexit.register(flush)
+
+
+def collect():
+    """{(имя, метки): значение} по всем процессам или по этому."""
+    if settings.METRICS_DB is None:
+        with _lock:
+            return dict(_values)
+    flush()
+    values = {}
+    for key, value in connection().execute('SELECT key, value FROM metrics'):
+        name, labels = json.loads(key)
+        values[name, tuple(map(tuple, labels))] = value
+    return values
+
+
+def family(name):
+    """Имя метрики, к которой относится образец (без _bucket и т. п.)."""
+    if name in METRICS:
+        return name
+    return name.rsplit('_', 1)[0]
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(key, value.replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for key, value in labels)
+    return '{' + pairs + '}'
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus 0.0.4."""
+    samples = defaultdict(list)
+    for (name, labels), value in collect().items():
+        samples[family(name)].append((name, labels, value))
+    lines = []
+    for name, metric in METRICS.items():
+        lines.append(f'# HELP {name} {metric.help}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for sample, labels, value in sorted(samples[name], key=sort_key):
+            lines.append(
+                f'{sample}{format_labels(labels)} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def format_value(value):
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def sort_key(sample):
+    name, labels, _ = sample
+    bound = dict(labels).get('le')
+    if bound is None:
+        return name, labels, 0
+    # Корзины идут по возрастанию границы, +Inf последней.
+    rest = tuple(label for label in labels if label[0] != 'le')
+    return name, rest, float(bound)
+
+
+def reset():
+    """Обнуляет метрики процесса и общего файла (для тестов)."""
+    with _lock:
+        _values.clear()
+    if settings.METRICS_DB is not None:
+        connection().execute('DELETE FROM metrics')
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('fingerprint', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('sql', models.TextField()),
+                ('view', models.CharField(blank=True, max_length=200)),
+                ('plan', models.TextField(blank=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('last_seen', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
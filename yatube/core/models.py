@@ -10,3 +10,18 @@ class CreatedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class SlowQuery(models.Model):
+    """Медленный SQL-запрос, сведённый к отпечатку без значений."""
+    fingerprint = models.CharField(max_length=32, primary_key=True)
+    sql = models.TextField()
+    view = models.CharField(max_length=200, blank=True)
+    plan = models.TextField(blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    last_seen = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return self.sql[:50]
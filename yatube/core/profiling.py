@@ -0,0 +1,328 @@
+"""Лёгкое профилирование запросов в боевом режиме.
+
+ProfilingMiddleware замеряет у каждого запроса общее время, число и
+время SQL-запросов (execute_wrapper), время отрисовки шаблонов и
+попадания в кэш. Замеры копятся по именам представлений в памяти
+процесса и отдаются страницей /profiling/ для персонала, а персоналу
+и адресам из INTERNAL_IPS время ответа, SQL и шаблонов приходит ещё
+и в заголовке Server-Timing. Доля
+PROFILING_SAMPLE_RATE запросов (и запросы персонала с ?profile)
+выполняется под cProfile, а самые дорогие функции сохраняются среди
+последних PROFILING_SAMPLES профилей. Медленные запросы пишутся
+в лог core.profiling одной строкой JSON.
+
+Шаблоны и кэш считаются через обёртки методов, которые ставит
+instrument() при запуске приложения.
+"""
+import cProfile
+import functools
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+_local = threading.local()
+_lock = threading.Lock()
+_views = {}
+_samples = deque()
+_started = time.time()
+
+
+class RequestStats:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.wall = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Вложенные шаблоны и get внутри get_many не считаются дважды.
+        self.template_depth = 0
+        self.cache_depth = 0
+
+
+class ViewStats:
+    """Накопленные замеры одного представления."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.wall = 0.0
+        self.max_wall = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.recent = deque(maxlen=settings.PROFILING_WINDOW)
+
+    def add(self, stats, status):
+        self.count += 1
+        self.errors += status >= 500
+        self.wall += stats.wall
+        self.max_wall = max(self.max_wall, stats.wall)
+        self.sql_count += stats.sql_count
+        self.sql_time += stats.sql_time
+        self.template_time += stats.template_time
+        self.cache_hits += stats.cache_hits
+        self.cache_misses += stats.cache_misses
+        self.recent.append(stats.wall)
+
+    def as_dict(self):
+        recent = sorted(self.recent)
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'wall_ms': {
+                'avg': ms(self.wall / self.count),
+                'p50': ms(recent[int(len(recent) * 0.5)]),
+                'p95': ms(recent[int(len(recent) * 0.95)]),
+                'max': ms(self.max_wall),
+            },
+            'sql_count_avg': round(self.sql_count / self.count, 1),
+            'sql_ms_avg': ms(self.sql_time / self.count),
+            'template_ms_avg': ms(self.template_time / self.count),
+            'cache_hit_ratio': (round(self.cache_hits / lookups, 3)
+                                if lookups else None),
+        }
+
+
+def ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def current():
+    return getattr(_local, 'stats', None)
+
+
+def sql_timer(execute, sql, params, many, context):
+    stats = current()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    stats.sql_count += 1
+    stats.sql_time += time.perf_counter() - started
+    return result
+
+
+def timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, *args, **kwargs):
+        stats = current()
+        if stats is None:
+            return render(self, *args, **kwargs)
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            stats.template_depth -= 1
+            if not stats.template_depth:
+                stats.template_time += time.perf_counter() - started
+    return wrapper
+
+
+def counted_get(get):
+    @functools.wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        stats = current()
+        if stats is None or stats.cache_depth:
+            return get(self, key, default, version)
+        stats.cache_depth += 1
+        try:
+            value = get(self, key, MISSING, version)
+        finally:
+            stats.cache_depth -= 1
+        if value is MISSING:
+            stats.cache_misses += 1
+            return default
+        stats.cache_hits += 1
+        return value
+    return wrapper
+
+
+def counted_get_many(get_many):
+    @functools.wraps(get_many)
+    def wrapper(self, keys, version=None):
+        stats = current()
+        if stats is None or stats.cache_depth:
+            return get_many(self, keys, version)
+        keys = list(keys)
+        stats.cache_depth += 1
+        try:
+            found = get_many(self, keys, version)
+        finally:
+            stats.cache_depth -= 1
+        stats.cache_hits += len(found)
+        stats.cache_misses += len(keys) - len(found)
+        return found
+    return wrapper
+
+
+def instrument():
+    """Оборачивает отрисовку шаблонов и чтение из настроенных кэшей."""
+    if getattr(Template.render, 'profiled', False):
+        return
+    Template.render = timed_render(Template.render)
+    Template.render.profiled = True
+    for options in settings.CACHES.values():
+        backend = import_string(options['BACKEND'])
+        if getattr(backend.get, 'profiled', False):
+            continue
+        backend.get = counted_get(backend.get)
+        backend.get_many = counted_get_many(backend.get_many)
+        backend.get.profiled = True
+
+
+def top_functions(profiler, limit):
+    """Самые дорогие функции профиля по суммарному времени."""
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+    return [
+        {
+            'function': f'{os.path.basename(filename)}:{line}({name})',
+            'calls': calls,
+            'own_ms': ms(own),
+            'total_ms': ms(total),
+        }
+        for (filename, line, name), (_, calls, own, total, _) in
+        rows[:limit]
+    ]
+
+
+def record(view, path, stats, status, profiler=None):
+    sample = None
+    if profiler is not None:
+        sample = {
+            'view': view,
+            'path': path,
+            'time': time.time(),
+            'wall_ms': ms(stats.wall),
+            'functions': top_functions(
+                profiler, settings.PROFILING_STACK_LIMIT),
+        }
+    with _lock:
+        if view not in _views:
+            _views[view] = ViewStats()
+        _views[view].add(stats, status)
+        if sample is not None:
+            _samples.append(sample)
+            while len(_samples) > settings.PROFILING_SAMPLES:
+                _samples.popleft()
+    entry = {
+        'view': view,
+        'path': path,
+        'status': status,
+        'wall_ms': ms(stats.wall),
+        'sql_count': stats.sql_count,
+        'sql_ms': ms(stats.sql_time),
+        'template_ms': ms(stats.template_time),
+        'cache_hits': stats.cache_hits,
+        'cache_misses': stats.cache_misses,
+    }
+    slow = stats.wall * 1000 >= settings.PROFILING_SLOW_MS
+    logger.log(logging.WARNING if slow else logging.DEBUG,
+               json.dumps(entry, ensure_ascii=False))
+
+
+def export(stats):
+    """Переносит чтения из кэша в метрики Prometheus.
+
+    Чтения считают только обёртки instrument(), поэтому эта метрика
+    есть лишь при профилировании; запросы и время ответа считает
+    core.request_metrics.
+    """
+    for result, count in (('hit', stats.cache_hits),
+                          ('miss', stats.cache_misses)):
+        if count:
+            metrics.inc('yatube_cache_gets_total', count, result=result)
+
+
+def snapshot():
+    """Сводка по представлениям и последние профили этого процесса."""
+    with _lock:
+        return {
+            'pid': os.getpid(),
+            'since': _started,
+            'views': {name: stats.as_dict()
+                      for name, stats in sorted(_views.items())},
+            'samples': list(_samples),
+        }
+
+
+def reset():
+    global _started
+    with _lock:
+        _views.clear()
+        _samples.clear()
+        _started = time.time()
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def shows_timing(self, request):
+        # Время SQL и шаблонов видят только персонал и свои адреса.
+        return (request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+                or request.user.is_staff)
+
+    def should_sample(self, request):
+        if 'profile' in request.GET and request.user.is_staff:
+            return True
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def __call__(self, request):
+        stats = RequestStats()
+        profiler = cProfile.Profile() if self.should_sample(request) else None
+        _local.stats = stats
+        started = time.perf_counter()
+        try:
+            response = self.run(request, profiler)
+        finally:
+            _local.stats = None
+        stats.wall = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        record(view, request.path, stats, response.status_code, profiler)
+        export(stats)
+        if self.shows_timing(request):
+            response['Server-Timing'] = (
+                f'app;dur={ms(stats.wall)}, db;dur={ms(stats.sql_time)}, '
+                f'tpl;dur={ms(stats.template_time)}')
+        return response
+
+    def run(self, request, profiler):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(sql_timer))
+            if profiler is None:
+                return self.get_response(request)
+            profiler.enable()
+            try:
+                return self.get_response(request)
+            finally:
+                profiler.disable()
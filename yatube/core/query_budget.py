@@ -0,0 +1,58 @@
+import functools
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Представление выполнило больше SQL-запросов, чем объявлено."""
+
+
+def describe(view_name, limit, queries):
+    sql = '\n'.join(query['sql'] for query in queries)
+    return (f'{view_name}: {len(queries)} запросов при бюджете {limit}\n'
+            f'{sql}')
+
+
+def query_budget(limit):
+    """Объявляет предельное число SQL-запросов представления.
+
+    Предел хранится в атрибуте query_budget и переживает остальные
+    декораторы. При DEBUG превышение прерывает обработку запроса.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not settings.DEBUG:
+                return view(request, *args, **kwargs)
+            with CaptureQueriesContext(connection) as queries:
+                response = view(request, *args, **kwargs)
+            if len(queries) > limit:
+                raise QueryBudgetExceeded(
+                    describe(view.__name__, limit, queries.captured_queries))
+            return response
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
+
+
+class QueryBudgetTestMixin:
+    """Проверка бюджета запросов для TestCase.
+
+    Запросы считает сам декоратор query_budget при DEBUG, поэтому тест
+    меряет то же, что и проверка в работе: только запросы
+    представления, без сессии, пользователя и ETag.
+    """
+
+    def assertWithinQueryBudget(self, client, url, **kwargs):
+        view = resolve(urlsplit(url).path).func
+        self.assertTrue(hasattr(view, 'query_budget'),
+                        f'{view.__name__}: бюджет запросов не объявлен')
+        with override_settings(DEBUG=True):
+            try:
+                return client.get(url, **kwargs)
+            except QueryBudgetExceeded as error:
+                self.fail(error)
@@ -0,0 +1,49 @@
+"""Метрики HTTP-запросов для /metrics.
+
+RequestMetricsMiddleware считает у каждого запроса код ответа, время
+и число SQL-запросов (execute_wrapper на всех соединениях) и передаёт
+их в core.metrics по имени представления. От PROFILING_ENABLED
+middleware не зависит: с выключенным профилированием /metrics
+по-прежнему отдаёт запросы и время ответа.
+"""
+import threading
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from . import metrics
+
+_local = threading.local()
+
+
+def sql_counter(execute, sql, params, many, context):
+    if getattr(_local, 'queries', None) is not None:
+        _local.queries += 1
+    return execute(sql, params, many, context)
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.queries = 0
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(sql_counter))
+                response = self.get_response(request)
+        finally:
+            queries, _local.queries = _local.queries, None
+        wall = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.inc('yatube_http_requests_total', view=view,
+                    method=request.method, status=response.status_code)
+        metrics.observe('yatube_http_request_duration_seconds',
+                        wall, view=view)
+        metrics.inc('yatube_db_queries_total', queries, view=view)
+        return response
@@ -0,0 +1,137 @@
+"""Журнал медленных SQL-запросов.
+
+SlowQueryMiddleware ставит на все соединения обёртку курсора и
+запоминает запросы дольше SLOW_QUERY_MS независимо от профилирования
+(None в SLOW_QUERY_MS отключает журнал). Запрос сводится к отпечатку:
+литералы и параметры заменяются на ?, списки IN — на (...). После
+ответа для нового отпечатка процесс один раз снимает план (EXPLAIN
+QUERY PLAN в SQLite, EXPLAIN в остальных базах), а медленные запросы
+пишутся в лог и складываются в таблицу SlowQuery по отпечатку вместе
+с представлением, которое их вызвало; команда slow_queries выводит
+худшие из них.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER = re.compile(r'%s')
+IN_LIST = re.compile(r'\bIN \((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE)
+SPACE = re.compile(r'\s+')
+EXPLAIN = {'sqlite': 'EXPLAIN QUERY PLAN '}
+
+_plans = {}
+_local = threading.local()
+
+
+def normalize(sql):
+    sql = STRING.sub('?', sql)
+    sql = PLACEHOLDER.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    sql = IN_LIST.sub('IN (...)', sql)
+    return SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.md5(normalize(sql).encode()).hexdigest()
+
+
+def explain(connection, sql, params):
+    """План запроса SELECT или пустая строка."""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return ''
+    prefix = EXPLAIN.get(connection.vendor, 'EXPLAIN ')
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+    except DatabaseError:
+        return ''
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+def sql_watcher(execute, sql, params, many, context):
+    queries = getattr(_local, 'queries', None)
+    if queries is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    elapsed = (time.perf_counter() - started) * 1000
+    if not many and elapsed >= settings.SLOW_QUERY_MS:
+        queries.append((context['connection'], sql, params, elapsed))
+    return result
+
+
+def flush(view, queries):
+    """Пишет медленные запросы в лог и в таблицу SlowQuery."""
+    grouped = defaultdict(list)
+    samples = {}
+    for connection, sql, params, elapsed in queries:
+        key = fingerprint(sql)
+        if key not in _plans:
+            _plans[key] = explain(connection, sql, params)
+        grouped[key].append(elapsed)
+        samples[key] = sql
+        logger.warning(json.dumps({
+            'view': view,
+            'fingerprint': key,
+            'ms': round(elapsed, 2),
+            'sql': normalize(sql),
+        }, ensure_ascii=False))
+    SlowQuery.objects.bulk_create(
+        [SlowQuery(fingerprint=key, sql=normalize(samples[key]))
+         for key in grouped],
+        ignore_conflicts=True,
+    )
+    now = timezone.now()
+    for key, times in grouped.items():
+        changes = {
+            'count': F('count') + len(times),
+            'total_ms': F('total_ms') + sum(times),
+            'max_ms': Greatest(F('max_ms'), max(times)),
+            'view': view,
+            'last_seen': now,
+        }
+        if _plans.get(key):
+            changes['plan'] = _plans[key]
+        SlowQuery.objects.filter(pk=key).update(**changes)
+
+
+class SlowQueryMiddleware:
+    def __init__(self, get_response):
+        if settings.SLOW_QUERY_MS is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = _local.queries = []
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(sql_watcher))
+                response = self.get_response(request)
+        finally:
+            # EXPLAIN и запись журнала сами в журнал не попадают.
+            _local.queries = None
+        if queries:
+            match = request.resolver_match
+            flush(match.view_name if match else 'unresolved', queries)
+        return response
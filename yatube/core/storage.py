@@ -0,0 +1,86 @@
+"""Файловое хранилище с именами по хэшу содержимого."""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CONTENT_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Кладёт файл в <каталог>/<sha256[:2]>/<sha256><расширение>.
+
+    Одинаковые загрузки получают одно имя и хранятся один раз, поэтому
+    удалять файл можно, только когда на него не осталось ссылок.
+    """
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        hexdigest = digest.hexdigest()
+        return os.path.join(
+            directory, hexdigest[:2], hexdigest + extension
+        ).replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        # get_available_name не нужен: занятое имя — тот же файл.
+        return self._save(name, content)
+
+    def _save(self, name, content):
+        """Пишет во временный файл и атомарно ставит его под имя.
+
+        Одновременные одинаковые загрузки не пишут в один файл, и
+        недописанный файл никто не увидит; если имя уже занято, такой
+        же файл уже лежит на месте.
+        """
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        if self.directory_permissions_mode is not None:
+            os.makedirs(
+                directory, self.directory_permissions_mode, exist_ok=True)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f'{full_path}.{uuid.uuid4().hex}.part'
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL
+                     | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                for chunk in content.chunks():
+                    stream.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            try:
+                os.link(temp_path, full_path)
+            except FileExistsError:
+                pass
+            except OSError:
+                # Без жёстких ссылок: замена тоже атомарна, а под этим
+                # именем всегда одно и то же содержимое.
+                os.replace(temp_path, full_path)
+        finally:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+        return name
+
+    @staticmethod
+    def is_content_addressed(name):
+        return bool(name) and CONTENT_NAME.search(name) is not None
@@ -0,0 +1,47 @@
+"""Окружение тестов: кэш и метрики во временном каталоге.
+
+Тесты чистят кэш и метрики, поэтому файлы dev-сервера (cache.sqlite3,
+metrics.sqlite3) им не отдаются. manage.py test подключает
+isolated_data через TEST_RUNNER, pytest — фикстурой в conftest.
+"""
+import copy
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from . import metrics
+
+
+@contextmanager
+def isolated_data():
+    """Переносит файлы кэша и метрик во временный каталог."""
+    directory = tempfile.mkdtemp(prefix='yatube-tests-')
+    caches = copy.deepcopy(settings.CACHES)
+    caches['default']['LOCATION'] = os.path.join(directory, 'cache.sqlite3')
+    try:
+        with override_settings(
+                CACHES=caches,
+                METRICS_DB=os.path.join(directory, 'metrics.sqlite3')):
+            try:
+                yield directory
+            finally:
+                # Иначе накопленное сбросит atexit в файл dev-сервера.
+                metrics.flush()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class IsolatedDataRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.isolated_data = isolated_data()
+        self.isolated_data.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self.isolated_data.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
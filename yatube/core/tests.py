@@ -0,0 +1,348 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+from django.test import override_settings
+
+from core import cache as page_cache
+from core import metrics, profiling, slow_queries
+from core.models import SlowQuery
+from core.cache_backends import SQLiteCache
+from core.management.commands.benchmark_views import routes
+from posts.models import Comment, Follow, Group, Post, User
+
+
+@override_settings(CACHE_XFETCH_BETA=0, CACHE_WAIT_TIMEOUT=0)
+class VersionedCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.calls = 0
+
+        @page_cache.cache_versioned(60, lambda: 'test')
+        def view(request):
+            self.calls += 1
+            return HttpResponse(str(self.calls))
+
+        self.view = view
+
+    def get(self):
+        return self.view(self.factory.get('/feed/')).content
+
+    def test_cached_until_generation_bump(self):
+        """Страница отдаётся из кэша до смены поколения ленты."""
+        hits = page_cache.stats['hit']
+        self.assertEqual(self.get(), b'1')
+        self.assertEqual(self.get(), b'1')
+        self.assertEqual(page_cache.stats['hit'], hits + 1)
+        page_cache.bump('test')
+        self.assertEqual(self.get(), b'2')
+
+    def test_stale_while_another_worker_recomputes(self):
+        """Пока страницу пересчитывает другой процесс, отдаётся старая."""
+        self.get()
+        page_cache.bump('test')
+        key = page_cache.get_cache_key(
+            self.factory.get('/feed/'), 'feed.test', 'GET', cache=cache)
+        cache.add(page_cache.LOCK_PREFIX + key, 1)
+        stale = page_cache.stats['stale']
+        self.assertEqual(self.get(), b'1')
+        self.assertEqual(page_cache.stats['stale'], stale + 1)
+        cache.delete(page_cache.LOCK_PREFIX + key)
+        self.assertEqual(self.get(), b'2')
+
+    @override_settings(CACHE_XFETCH_BETA=10 ** 9)
+    def test_early_refresh(self):
+        """XFetch пересчитывает запись до истечения срока."""
+        self.get()
+        early = page_cache.stats['early']
+        self.assertEqual(self.get(), b'2')
+        self.assertEqual(page_cache.stats['early'], early + 1)
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.backend = self.make_backend()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_backend(self, **options):
+        options.setdefault('MAX_ENTRIES', 10)
+        options.setdefault('CULL_EVERY', 1)
+        return SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'),
+            {'OPTIONS': options},
+        )
+
+    def test_basic_operations(self):
+        """get/set/add/incr/get_many работают как у штатных бэкендов."""
+        backend = self.backend
+        self.assertIsNone(backend.get('missing'))
+        backend.set_many({'a': 1, 'b': [2]})
+        self.assertEqual(backend.get_many(['a', 'b', 'c']), {'a': 1, 'b': [2]})
+        self.assertFalse(backend.add('a', 5))
+        self.assertTrue(backend.add('c', 3))
+        self.assertEqual(backend.incr('a', 10), 11)
+        with self.assertRaises(ValueError):
+            backend.incr('missing')
+        backend.delete('a')
+        self.assertIsNone(backend.get('a'))
+        backend.set('expired', 1, -1)
+        self.assertTrue(backend.add('expired', 2))
+
+    def test_evicts_least_recently_read(self):
+        """Сверх MAX_ENTRIES вытесняются давно не читавшиеся записи."""
+        backend = self.make_backend(L1_TIMEOUT=0, CULL_FREQUENCY=0)
+        backend.set('hot', 1)
+        for i in range(10):
+            backend.set(f'cold{i}', i)
+            backend.connection.execute(
+                "UPDATE cache SET accessed = 0 WHERE key LIKE '%cold%'")
+        self.assertEqual(backend.get('hot'), 1)
+        self.assertIsNone(backend.get('cold0'))
+
+    def test_shared_between_processes(self):
+        """Запись из другого процесса видна, L1 обходится для счётчиков."""
+        backend = self.make_backend(L1_BYPASS=('counter',))
+        backend.set('counter', 1)
+        self.assertEqual(backend.get('counter'), 1)
+        process = multiprocessing.get_context('fork').Process(
+            target=backend.incr, args=('counter',))
+        process.start()
+        process.join()
+        self.assertEqual(backend.get('counter'), 2)
+
+
+class BenchmarkViewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        post = Post.objects.create(
+            author=author, group=group, text='Тестовый пост о кошках')
+        Comment.objects.create(post=post, author=reader, text='Да')
+        Follow.objects.create(user=reader, author=author)
+
+    def test_every_route_is_measured(self):
+        """Замер обходит все адреса posts и users и не меняет данные."""
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('benchmark_views', requests=2, warmup=0,
+                         output=output.name, stdout=StringIO())
+            results = json.load(output)['routes']
+        self.assertEqual(set(results), {name for name, _ in routes()})
+        for name, result in results.items():
+            with self.subTest(name=name):
+                self.assertLess(result['status'], 500)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(Follow.objects.count(), 1)
+
+
+@override_settings(PROFILING_SAMPLE_RATE=0)
+class ProfilingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        Post.objects.create(author=cls.staff, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        profiling.reset()
+
+    def test_request_is_measured(self):
+        """Запрос попадает в сводку с замерами SQL, шаблонов и кэша."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+        self.client.get(reverse('posts:index'))
+        stats = profiling.snapshot()['views']['posts:index']
+        self.assertEqual(stats['count'], 2)
+        self.assertGreater(stats['sql_count_avg'], 0)
+        self.assertGreater(stats['template_ms_avg'], 0)
+        self.assertGreater(stats['cache_hit_ratio'], 0)
+        self.assertEqual(profiling.snapshot()['samples'], [])
+
+    def test_server_timing_is_internal(self):
+        url = reverse('posts:index')
+        with self.settings(INTERNAL_IPS=['127.0.0.1']):
+            self.assertIn('db;dur=', self.client.get(url)['Server-Timing'])
+        self.client.force_login(self.staff)
+        self.assertIn('db;dur=', self.client.get(url)['Server-Timing'])
+
+    def test_staff_can_request_profile(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('posts:index'), {'profile': ''})
+        sample, = profiling.snapshot()['samples']
+        self.assertEqual(sample['view'], 'posts:index')
+        self.assertTrue(sample['functions'])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_SAMPLES=2)
+    def test_only_recent_samples_are_kept(self):
+        for _ in range(3):
+            self.client.get(reverse('posts:index'))
+        self.assertEqual(len(profiling.snapshot()['samples']), 2)
+
+    def test_stats_page_is_staff_only(self):
+        url = reverse('profiling')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.staff)
+        self.client.get(reverse('posts:index'))
+        self.assertIn('posts:index', self.client.get(url).json()['views'])
+        self.assertEqual(self.client.post(url).json()['views'], {})
+
+
+class SlowQueryLogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            slow_queries.normalize(
+                "SELECT * FROM t WHERE a = 'x' AND b IN (%s, %s) LIMIT 10"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) LIMIT ?')
+        self.assertEqual(
+            slow_queries.fingerprint('SELECT 1 FROM t WHERE id IN (%s)'),
+            slow_queries.fingerprint('SELECT 2 FROM t WHERE id IN (%s, %s)'))
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged_with_plan(self):
+        """Медленные запросы складываются по отпечатку с планом."""
+        self.client.force_login(self.user)
+        with self.assertLogs('core.slow_queries', 'WARNING'):
+            self.client.get(reverse('posts:follow_index'))
+            self.client.get(reverse('posts:follow_index'))
+        query = SlowQuery.objects.filter(
+            sql__contains='posts_timeline').get()
+        self.assertEqual(query.view, 'posts:follow_index')
+        self.assertGreaterEqual(query.count, 2)
+        self.assertIn('posts_timeline', query.plan)
+        out = StringIO()
+        call_command('slow_queries', plans=True, stdout=out)
+        self.assertIn(query.fingerprint[:8], out.getvalue())
+        call_command('slow_queries', reset=True, stdout=StringIO())
+        self.assertFalse(SlowQuery.objects.exists())
+
+    @override_settings(SLOW_QUERY_MS=0, PROFILING_ENABLED=False)
+    def test_slow_queries_are_logged_without_profiling(self):
+        with self.assertLogs('core.slow_queries', 'WARNING'):
+            response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertTrue(SlowQuery.objects.filter(
+            view='posts:index', sql__contains='posts_post').exists())
+        self.assertFalse(SlowQuery.objects.filter(
+            sql__contains='EXPLAIN').exists())
+
+    def test_fast_queries_are_not_logged(self):
+        self.client.get(reverse('posts:index'))
+        self.assertFalse(SlowQuery.objects.exists())
+
+
+def bump_metric():
+    metrics.inc('yatube_cache_gets_total', result='hit')
+    metrics.observe('yatube_upload_size_bytes', 100000)
+    metrics.flush()
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='author')
+        Post.objects.create(author=user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    @override_settings(METRICS_DB=None, METRICS_TOKEN='secret')
+    def test_requests_are_exported(self):
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertIn('# TYPE yatube_http_requests_total counter', text)
+        self.assertIn(
+            'yatube_http_requests_total'
+            '{method="GET",status="200",view="posts:index"} 2', text)
+        self.assertIn(
+            'yatube_http_request_duration_seconds_count'
+            '{view="posts:index"} 2', text)
+        self.assertIn(
+            'yatube_page_cache_total{feed="index",result="miss"} 1', text)
+        self.assertIn(
+            'yatube_page_cache_total{feed="index",result="hit"} 1', text)
+
+    @override_settings(
+        METRICS_DB=None, METRICS_TOKEN='secret', PROFILING_ENABLED=False)
+    def test_requests_are_exported_without_profiling(self):
+        self.client.get(reverse('posts:index'))
+        text = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret',
+        ).content.decode()
+        self.assertIn(
+            'yatube_http_requests_total'
+            '{method="GET",status="200",view="posts:index"} 1', text)
+        self.assertIn(
+            'yatube_http_request_duration_seconds_count'
+            '{view="posts:index"} 1', text)
+        self.assertRegex(
+            text, r'yatube_db_queries_total\{view="posts:index"\} [1-9]')
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_require_token_or_staff(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(User.objects.create_user(
+            username='admin', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_metrics_without_token_are_closed(self):
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer None')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_DB=None)
+    def test_histogram_buckets_are_cumulative(self):
+        metrics.observe('yatube_upload_size_bytes', 100000)
+        metrics.observe('yatube_upload_size_bytes', 10 ** 9)
+        text = metrics.render()
+        self.assertIn('yatube_upload_size_bytes_bucket{le="65536"} 0', text)
+        self.assertIn('yatube_upload_size_bytes_bucket{le="262144"} 1', text)
+        self.assertIn('yatube_upload_size_bytes_bucket{le="+Inf"} 2', text)
+        self.assertIn('yatube_upload_size_bytes_count 2', text)
+        self.assertLess(text.index('le="262144"'), text.index('le="+Inf"'))
+
+    def test_processes_are_summed(self):
+        """Сброшенное разными процессами складывается в общем файле."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'metrics.sqlite3')
+        with override_settings(METRICS_DB=path):
+            bump_metric()
+            process = multiprocessing.get_context('fork').Process(
+                target=bump_metric)
+            process.start()
+            process.join()
+            text = metrics.render()
+        self.assertIn('yatube_cache_gets_total{result="hit"} 2', text)
+        self.assertIn('yatube_upload_size_bytes_sum 200000', text)
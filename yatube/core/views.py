@@ -1,4 +1,12 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_http_methods
+
+from . import metrics, profiling
 
 
 def page_not_found(request, exception):
@@ -15,3 +23,33 @@ def permission_denied(request, exception):
 
 def server_error(request):
     return render(request, 'core/500.html', status=500)
+
+
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def profiling_stats(request):
+    """Сводка профилирования процесса; POST обнуляет её."""
+    if request.method == 'POST':
+        profiling.reset()
+    return JsonResponse(
+        profiling.snapshot(),
+        json_dumps_params={'ensure_ascii': False, 'indent': 2},
+    )
+
+
+def can_scrape(request):
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and constant_time_compare(header, f'Bearer {token}'):
+        return True
+    return request.user.is_staff
+
+
+def prometheus_metrics(request):
+    """Метрики для Prometheus: по токену METRICS_TOKEN или персоналу."""
+    if not can_scrape(request):
+        raise PermissionDenied
+    return HttpResponse(
+        metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
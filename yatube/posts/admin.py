@@ -1,34 +1,74 @@
 from django.contrib import admin
 
+from . import search
 from .models import Comment, Follow, Group, Post
+from .utils import EstimatedCountPaginator
 
 
-class PostAdmin(admin.ModelAdmin):
+class ScalableAdmin(admin.ModelAdmin):
+    """Общие настройки списков для таблиц на миллионы строк."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    empty_value_display = '-пусто-'
+
+
+class PostAdmin(ScalableAdmin):
     list_display = (
         'pk',
         'text',
         'pub_date',
         'author',
         'group',
+        'comments_count',
     )
-    list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
-    empty_value_display = '-пусто-'
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по полнотекстовому индексу вместо LIKE '%...%'.
+        if not search_term:
+            return queryset, False
+        return queryset.filter(pk__in=search.post_ids(search_term)), False
 
 
 class GroupAdmin(admin.ModelAdmin):
-    llist_display = (
+    list_display = (
         'pk',
         'title',
         'description',
         'slug',
+        'posts_count',
     )
     search_fields = ('title',)
     prepopulated_fields = {'slug': ('title',)}
 
 
+class CommentAdmin(ScalableAdmin):
+    list_display = (
+        'pk',
+        'text',
+        'created',
+        'author',
+        'post',
+    )
+    list_select_related = ('author', 'post')
+    raw_id_fields = ('post',)
+    autocomplete_fields = ('author',)
+
+
+class FollowAdmin(ScalableAdmin):
+    list_display = (
+        'pk',
+        'user',
+        'author',
+    )
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
-admin.site.register(Follow)
-admin.site.register(Comment)
+admin.site.register(Comment, CommentAdmin)
+admin.site.register(Follow, FollowAdmin)
@@ -1,5 +1,25 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_migrate
+
+SEARCH_MIGRATION = ('posts', '0016_post_search')
+
+
+def install_search(sender, using, **kwargs):
+    # Миграции SQLite пересоздают таблицу постов вместе с триггерами.
+    # Пока индекс не создан своей миграцией (migrate auth на пустой
+    # базе, migrate posts zero), таблицы постов может и не быть.
+    from . import search
+    connection = connections[using]
+    applied = MigrationRecorder(connection).applied_migrations()
+    if SEARCH_MIGRATION in applied:
+        search.install(connection)
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(install_search, sender=self)
@@ -0,0 +1,66 @@
+"""Счётчики ссылок постов на файлы картинок.
+
+Картинки хранятся по хэшу содержимого (core.storage), и один файл
+может принадлежать нескольким постам, а значит, и его копии. Число
+постов, ссылающихся на файл, хранится в ImageBlob и меняется из
+сигналов, как остальные счётчики. Когда ссылок не осталось, файл,
+его варианты и копии удаляются после фиксации транзакции.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import counters, images, thumbnails
+from .models import ImageBlob, Post, Rendition
+
+
+def tracked(name):
+    return images.storage().is_content_addressed(name)
+
+
+def acquire(name):
+    if not tracked(name):
+        return
+    ImageBlob.objects.bulk_create(
+        [ImageBlob(name=name)], ignore_conflicts=True)
+    counters.bump(ImageBlob, name, references=1)
+
+
+def release(name):
+    if not tracked(name):
+        return
+    counters.bump(ImageBlob, name, references=-1)
+    transaction.on_commit(lambda: collect(name))
+
+
+def collect(name):
+    """Удаляет файл без ссылок вместе с его вариантами и копиями."""
+    deleted, _ = ImageBlob.objects.filter(name=name, references=0).delete()
+    if not deleted:
+        return False
+    images.storage().delete(name)
+    for image_format in settings.POST_IMAGE_VARIANTS:
+        default_storage.delete(images.variant_name(name, image_format))
+    files = set(Rendition.objects.filter(
+        image=name).values_list('file', flat=True))
+    Rendition.objects.filter(image=name).delete()
+    # Одинаковые копии разных картинок хранятся в одном файле.
+    files -= set(Rendition.objects.filter(
+        file__in=files).values_list('file', flat=True))
+    for file in files:
+        default_storage.delete(file)
+    cache.delete(thumbnails.RENDITIONS_PREFIX + name)
+    return True
+
+
+def recount():
+    """Пересчитывает ссылки на файлы по фактическим постам."""
+    names = Post.objects.exclude(image='').order_by().values_list(
+        'image', flat=True).distinct()
+    ImageBlob.objects.bulk_create(
+        (ImageBlob(name=name) for name in names.iterator() if tracked(name)),
+        ignore_conflicts=True,
+    )
+    return ImageBlob.objects.update(
+        references=counters.count_of(Post, 'image'))
@@ -0,0 +1,92 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются одним UPDATE ... SET n = n + 1 из сигналов
+сохранения и удаления, а команда recount пересчитывает их заново.
+"""
+from django.apps import apps as global_apps
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Group, Post, UserStats
+
+
+def bump(model, pk, **deltas):
+    """Атомарно сдвигает счётчики строки; вернёт число изменённых строк.
+
+    Счётчик не опускается ниже нуля, даже если успел разойтись
+    с данными до очередного recount.
+    """
+    if pk is None:
+        return 0
+    return model.objects.filter(pk=pk).update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+
+
+def bump_user(user_id, **deltas):
+    """Сдвигает счётчики пользователя; строку без счётчиков досчитывает.
+
+    При уменьшении отсутствующую строку не создаём: так бывает, когда
+    пользователь удаляется каскадом вместе со своей статистикой.
+    """
+    if bump(UserStats, user_id, **deltas):
+        return
+    if any(delta > 0 for delta in deltas.values()):
+        recount_users(user_ids=[user_id])
+
+
+def bump_group(group_id, delta):
+    bump(Group, group_id, posts_count=delta)
+
+
+def bump_post(post_id, delta):
+    bump(Post, post_id, comments_count=delta)
+
+
+def count_of(model, field):
+    """Подзапрос «число строк model, ссылающихся на OuterRef('pk')»."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+def recount_users(user_ids=None, apps=global_apps):
+    User = apps.get_model('auth', 'User')
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk)
+         for pk in users.values_list('pk', flat=True).iterator()),
+        ignore_conflicts=True,
+    )
+    stats = UserStats.objects.all()
+    if user_ids is not None:
+        stats = stats.filter(pk__in=user_ids)
+    return stats.update(
+        posts_count=count_of(Post, 'author'),
+        followers_count=count_of(Follow, 'author'),
+        following_count=count_of(Follow, 'user'),
+    )
+
+
+def recount(apps=global_apps):
+    """Пересчитывает все счётчики по фактическим данным."""
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    return {
+        'groups': Group.objects.update(
+            posts_count=count_of(Post, 'group')),
+        'posts': Post.objects.update(
+            comments_count=count_of(Comment, 'post')),
+        'users': recount_users(apps=apps),
+    }
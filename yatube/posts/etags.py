@@ -0,0 +1,62 @@
+"""ETag для условных GET: повторный запрос без выборки и рендера.
+
+ETag лент строится из поколений кэша (см. core.cache), поэтому
+ответ 304 стоит одного чтения кэша. Отданной странице ETag ставит
+cache_versioned по поколениям, на которых она построена, чтобы
+устаревшая копия не получила ETag свежей. ETag поста — из его версии,
+счётчиков и времени последнего комментария, одним запросом по
+первичному ключу. Last-Modified не отдаём: правка поста не меняет
+pub_date, и If-Modified-Since давал бы ложные 304.
+"""
+import hashlib
+
+from django.contrib.auth import SESSION_KEY
+from django.db.models import OuterRef, Subquery
+
+from core import cache as page_cache
+
+from . import invalidation, markup
+from .models import Comment, Post
+
+
+def viewer(request):
+    # Шапка, кнопка подписки и форма комментария зависят от того,
+    # кто вошёл; request.user ради этого не загружаем.
+    return request.session.get(SESSION_KEY, '')
+
+
+def make_etag(request, *parts):
+    # Смена отрисовщика текста меняет страницы без правки постов.
+    data = ':'.join(map(str, (viewer(request), markup.VERSION, *parts)))
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+def served(request, versions):
+    """ETag страницы ленты, построенной на поколениях versions."""
+    return make_etag(request, *versions)
+
+
+def feed_etag(feed):
+    def etag(request, **kwargs):
+        return served(
+            request, page_cache.generations(page_cache.ALL, feed(**kwargs)))
+    return etag
+
+
+index = feed_etag(invalidation.index_feed)
+group_posts = feed_etag(invalidation.group_feed)
+profile = feed_etag(invalidation.profile_feed)
+
+
+def post_detail(request, post_id):
+    last_comment = Comment.objects.filter(
+        post=OuterRef('pk')).order_by('-created').values('created')[:1]
+    state = Post.objects.filter(pk=post_id).order_by('pk').values_list(
+        'version', 'comments_count', 'author__stats__posts_count',
+        Subquery(last_comment),
+    ).first()
+    if state is None:
+        return None
+    # Переименование групп сбрасывает общее поколение.
+    return make_etag(
+        request, *state, *page_cache.generations(page_cache.ALL))
@@ -0,0 +1,218 @@
+"""Лента подписок: гибрид push (Timeline) и pull (посты «звёзд»).
+
+Посты обычных авторов при публикации раскладываются по лентам
+подписчиков. Посты «звёзд» (UserStats.pulled) не раскладываются: при
+выдаче ленты они читаются напрямую и сливаются с Timeline. Состав
+«звёзд» по порогу FEED_CELEBRITY_THRESHOLD пересчитывает reclassify()
+(команда reclassify_celebrities), а не запросы страниц.
+"""
+import heapq
+import logging
+import time
+from collections import Counter
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import Follow, Post, Timeline, UserStats
+from .utils import KEYSET_FIELDS, KeysetPaginator, paginate_func
+
+TIMELINE_FIELDS = ('pub_date', 'post_id')
+CELEBRITIES_CACHE_KEY = 'feed:celebrities'
+
+logger = logging.getLogger(__name__)
+merge_stats = Counter()
+
+
+def celebrities():
+    """Множество id авторов, чьи посты читаются при выдаче ленты.
+
+    Только читает флаг UserStats.pulled, закэшированный на
+    FEED_CELEBRITY_CACHE_TIME секунд.
+    """
+    ids = cache.get(CELEBRITIES_CACHE_KEY)
+    if ids is None:
+        ids = frozenset(UserStats.objects.filter(
+            pulled=True).values_list('user_id', flat=True))
+        cache.set(
+            CELEBRITIES_CACHE_KEY, ids, settings.FEED_CELEBRITY_CACHE_TIME)
+    return ids
+
+
+def reclassify():
+    """Пересчитывает «звёзд» по числу подписчиков: (новые, выпавшие).
+
+    Выпавшему автору флаг снимается в одной транзакции с
+    дозаполнением лент его подписчиков, поэтому сбой посередине не
+    оставит ленты без постов, опубликованных в статусе «звезды».
+    """
+    threshold = settings.FEED_CELEBRITY_THRESHOLD
+    added = list(UserStats.objects.filter(
+        pulled=False, followers_count__gte=threshold,
+    ).values_list('user_id', flat=True))
+    dropped = list(UserStats.objects.filter(
+        pulled=True, followers_count__lt=threshold,
+    ).values_list('user_id', flat=True))
+    UserStats.objects.filter(user_id__in=added).update(pulled=True)
+    for author_id in dropped:
+        with transaction.atomic():
+            UserStats.objects.filter(user_id=author_id).update(pulled=False)
+            push_author(author_id)
+    if added or dropped:
+        cache.delete(CELEBRITIES_CACHE_KEY)
+    return added, dropped
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if post.author_id in celebrities():
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    # Размер пачки Django выбирает сам по пределу параметров бэкенда.
+    Timeline.objects.bulk_create(
+        (Timeline(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту читателя уже опубликованные посты автора."""
+    if author_id in celebrities():
+        return
+    posts = Post.objects.filter(
+        author_id=author_id).values_list('pk', 'pub_date')
+    Timeline.objects.bulk_create(
+        (Timeline(user_id=user_id, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts.iterator()),
+        ignore_conflicts=True,
+    )
+
+
+def push_author(author_id):
+    """Дозаполняет ленты всех подписчиков автора его постами."""
+    insert_entries(Follow.objects.filter(author_id=author_id),
+                   ignore_conflicts=True)
+
+
+def insert_entries(follows, ignore_conflicts=False):
+    """Кладёт в ленты посты авторов из follows одним INSERT ... SELECT."""
+    rows = follows.filter(author__posts__isnull=False).order_by().values_list(
+        'user_id', 'author__posts__pk', 'author__posts__pub_date')
+    sql, params = rows.query.sql_with_params()
+    ops = connection.ops
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{ops.insert_statement(ignore_conflicts=ignore_conflicts)} '
+            f'{Timeline._meta.db_table} (user_id, post_id, pub_date) {sql} '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts)}',
+            params,
+        )
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты читателя посты автора после отписки."""
+    Timeline.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def rebuild(users=None):
+    """Пересобирает ленты заново по таблице подписок.
+
+    Ленты заполняются одним INSERT ... SELECT по соединению подписок
+    с постами, без выборки строк в Python.
+    """
+    entries = Timeline.objects.all()
+    follows = Follow.objects.all()
+    if users is not None:
+        entries = entries.filter(user__in=users)
+        follows = follows.filter(user__in=users)
+    count = follows.count()
+    with transaction.atomic():
+        entries.delete()
+        insert_entries(follows.exclude(author__in=celebrities()))
+    return count
+
+
+class MergedPaginator(KeysetPaginator):
+    """Курсорный пагинатор поверх нескольких упорядоченных источников.
+
+    Источник — пара (queryset, поля ключа). С каждого берётся не больше
+    страницы записей за границей курсора, затем потоки сливаются
+    heapq.merge по ключу (дата, id поста) с удалением повторов.
+    """
+
+    def __init__(self, sources, per_page, after=None, before=None):
+        super().__init__(
+            Post.objects.none(), per_page, after=after, before=before)
+        self.sources = sources
+
+    @property
+    def count(self):
+        return sum(queryset.count() for queryset, _ in self.sources)
+
+    def fetch(self, cursor, forward, limit):
+        started = time.perf_counter()
+        streams = []
+        for queryset, fields in self.sources:
+            rows = self.fetch_from(queryset, fields, cursor, forward, limit)
+            merge_stats['rows_fetched'] += len(rows)
+            streams.append([
+                (getattr(row, fields[0]), getattr(row, fields[1]), row)
+                for row in rows
+            ])
+        merged = heapq.merge(
+            *streams,
+            key=itemgetter(0, 1),
+            reverse=forward == self.descending,
+        )
+        items = []
+        seen = set()
+        for _, pk, row in merged:
+            if pk in seen:
+                continue
+            seen.add(pk)
+            items.append(row.post if isinstance(row, Timeline) else row)
+            if len(items) == limit:
+                break
+        elapsed = time.perf_counter() - started
+        merge_stats['merges'] += 1
+        merge_stats['sources'] += len(self.sources)
+        merge_stats['seconds'] += elapsed
+        logger.debug('feed merge: k=%d rows=%d %.2fms', len(self.sources),
+                     len(items), elapsed * 1000)
+        return items
+
+
+def get_page(request, user):
+    """Страница ленты подписок.
+
+    Без «звёзд» среди авторов — один проход по индексу Timeline,
+    иначе слияние Timeline с постами всех «звёзд» одним запросом.
+    """
+    entries = Timeline.objects.filter(user=user).select_related(
+        'post__author', 'post__group')
+    pulled = list(Follow.objects.filter(
+        user=user, author__in=celebrities()
+    ).values_list('author_id', flat=True))
+    if not pulled:
+        page_obj = paginate_func(request, entries, fields=TIMELINE_FIELDS)
+        page_obj.object_list = [entry.post for entry in page_obj]
+        return page_obj
+    # Посты всех «звёзд» — один источник: число запросов не растёт
+    # с числом звёзд среди подписок.
+    sources = [
+        (entries, TIMELINE_FIELDS),
+        (Post.objects.filter(author_id__in=pulled).select_related(
+            'author', 'group'), KEYSET_FIELDS),
+    ]
+    paginator = MergedPaginator(
+        sources,
+        settings.POSTS_ON_PAGE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    return paginator.get_page()
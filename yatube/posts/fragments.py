@@ -0,0 +1,45 @@
+"""Кэш отрисованных карточек постов для лент.
+
+Ключ карточки содержит id и версию поста, а версия растёт при правке
+поста и смене имени автора, поэтому устаревшие карточки просто
+перестают запрашиваться. В ключ входит и версия отрисовщика текста
+(posts.markup), так что после его смены карточки рисуются заново из
+перерисованного в памяти текста (Post.html). Карточки страницы
+читаются и пишутся одним get_many/set_many, а миниатюры недостающих —
+одним запросом.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import markup, thumbnails
+
+FRAGMENT_TEMPLATE = 'posts/includes/post_list.html'
+
+
+def fragment_key(post):
+    return f'post_fragment:{post.pk}:{post.version}:{markup.VERSION}'
+
+
+def attach_fragments(posts):
+    """Кладёт в post.fragment HTML карточки каждого поста страницы."""
+    keys = {fragment_key(post): post for post in posts}
+    cached = cache.get_many(keys)
+    missing = [post for key, post in keys.items() if key not in cached]
+    thumbnails.prefetch(missing)
+    rendered = {}
+    for key, post in keys.items():
+        html = cached.get(key)
+        if html is None:
+            html = rendered[key] = render_to_string(
+                FRAGMENT_TEMPLATE, {'post': post})
+        post.fragment = mark_safe(html)
+    if rendered:
+        cache.set_many(rendered, settings.POST_FRAGMENT_CACHE_TIME)
+
+
+def bump_versions(posts):
+    """Делает устаревшими карточки постов из queryset."""
+    posts.update(version=F('version') + 1)
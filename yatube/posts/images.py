@@ -0,0 +1,112 @@
+"""Нормализация картинок постов при загрузке.
+
+Загруженный файл проверяется по размеру в байтах и по числу пикселей
+до декодирования (Image.open читает только заголовок), большие
+картинки уменьшаются до POST_IMAGE_MAX_SIDE по длинной стороне, а
+EXIF удаляется после поворота по его ориентации. JPEG декодируется
+сразу в уменьшенном масштабе через draft(). Имя и формат файла
+сохраняются, поэтому ссылки и миниатюры остаются прежними.
+
+Варианты в современных форматах (POST_IMAGE_VARIANTS) пишутся рядом
+с оригиналом в фоне вместе с миниатюрами; форматы, которые текущая
+сборка Pillow записывать не умеет, пропускаются.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+from core import metrics
+from .models import Post
+
+# Форматы, которые имеет смысл перекодировать; GIF и прочие
+# (в том числе анимированные) сохраняются как есть.
+REENCODED_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+
+def storage():
+    """Хранилище оригиналов; производные файлы пишутся в default_storage."""
+    return Post._meta.get_field('image').storage
+
+
+def check_limits(upload, image):
+    if upload.size > settings.POST_IMAGE_MAX_BYTES:
+        raise ValidationError(
+            'Файл больше %(limit)s.',
+            code='file_too_large',
+            params={'limit': filesizeformat(settings.POST_IMAGE_MAX_BYTES)},
+        )
+    if image.width * image.height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка больше %(limit)s мегапикселей.',
+            code='too_many_pixels',
+            params={'limit': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6},
+        )
+
+
+def normalize(upload):
+    """Возвращает уменьшенную копию загрузки без EXIF или её саму."""
+    metrics.observe('yatube_upload_size_bytes', upload.size)
+    upload.seek(0)
+    with Image.open(upload) as image:
+        check_limits(upload, image)
+        if image.format not in REENCODED_FORMATS:
+            upload.seek(0)
+            return upload
+        limit = settings.POST_IMAGE_MAX_SIDE
+        too_large = max(image.size) > limit
+        if not too_large and 'exif' not in image.info:
+            upload.seek(0)
+            return upload
+        image_format = image.format
+        if image_format == 'JPEG':
+            image.draft('RGB', (limit, limit))
+        normalized = ImageOps.exif_transpose(image)
+        normalized.thumbnail((limit, limit), Image.LANCZOS)
+        normalized.info.pop('exif', None)
+        buffer = BytesIO()
+        normalized.save(
+            buffer,
+            image_format,
+            quality=settings.POST_IMAGE_QUALITY,
+            icc_profile=image.info.get('icc_profile'),
+        )
+    return SimpleUploadedFile(
+        upload.name, buffer.getvalue(), upload.content_type)
+
+
+def variant_name(name, image_format):
+    return f'{name}.{image_format.lower()}'
+
+
+def writable_formats():
+    Image.init()
+    return [image_format for image_format in settings.POST_IMAGE_VARIANTS
+            if image_format in Image.SAVE]
+
+
+def save_variants(name):
+    """Пишет рядом с оригиналом копии в современных форматах."""
+    formats = writable_formats()
+    if not formats:
+        return []
+    saved = []
+    with storage().open(name) as original, Image.open(original) as image:
+        if getattr(image, 'is_animated', False):
+            return []
+        image.load()
+        for image_format in formats:
+            target = variant_name(name, image_format)
+            buffer = BytesIO()
+            image.save(buffer, image_format,
+                       quality=settings.POST_IMAGE_QUALITY)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            content = ContentFile(buffer.getvalue())
+            saved.append(default_storage.save(target, content))
+    return saved
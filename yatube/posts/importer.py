@@ -0,0 +1,281 @@
+"""Потоковая загрузка фикстур с пользователями, группами и постами.
+
+Файл в формате dumpdata (JSON-массив) или NDJSON читается кусками, и
+в памяти не лежит больше одной пачки записей. Записи копятся по
+моделям и вставляются bulk_create в порядке зависимостей, а одна
+транзакция покрывает до chunk_size записей. Внешние ключи фикстуры
+переводятся в id базы через словари «id в файле -> id в базе»:
+пользователи и группы, которые уже есть, находятся по username и
+slug, новым строкам id выдаются подряд после наибольшего.
+
+bulk_create не шлёт сигналов, поэтому счётчики, ленты подписок и
+ссылки на картинки досчитываются в finish() только для затронутых
+строк. Полнотекстовый индекс обновляют триггеры БД.
+"""
+import json
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core import cache as page_cache
+from . import blobs, counters, feed, markup
+from .models import Comment, Follow, Group, Post, User
+
+READ_SIZE = 64 * 1024
+SEPARATORS = frozenset('[],\r\n\t ')
+USER_FIELDS = (
+    'password', 'last_login', 'is_superuser', 'username', 'first_name',
+    'last_name', 'email', 'is_staff', 'is_active', 'date_joined',
+)
+
+
+def iter_records(stream, size=READ_SIZE):
+    """Объекты из JSON-массива или NDJSON по одному, без чтения целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in SEPARATORS:
+            position += 1
+        if position < len(buffer):
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                pass
+            else:
+                yield record
+                continue
+        chunk = stream.read(size)
+        if not chunk:
+            if position < len(buffer):
+                # Хвост так и не разобрался: файл оборван или испорчен.
+                decoder.raw_decode(buffer, position)
+            return
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+@contextmanager
+def raw_dates(*models):
+    """Отключает auto_now и auto_now_add: даты берутся из фикстуры."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+        or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def in_batches(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Importer:
+    """Копит записи фикстуры и вставляет их пачками."""
+    models = {
+        'auth.user': User,
+        'posts.group': Group,
+        'posts.post': Post,
+        'posts.comment': Comment,
+        'posts.follow': Follow,
+    }
+
+    def __init__(self, batch_size=1000, chunk_size=20000):
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.pending = defaultdict(list)
+        self.pending_count = 0
+        self.ids = defaultdict(dict)
+        self.next_ids = {}
+        self.stats = Counter()
+        self.skipped = Counter()
+        self.touched = defaultdict(set)
+        self.started = time.perf_counter()
+
+    @property
+    def rows(self):
+        return sum(self.stats.values())
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.rows / elapsed if elapsed else 0.0
+
+    def add(self, record):
+        """Принимает запись; вернёт True, если после неё была вставка."""
+        label = record.get('model', '').lower()
+        if label not in self.models:
+            self.skipped[label] += 1
+            return False
+        self.pending[label].append(record)
+        self.pending_count += 1
+        if self.pending_count < self.chunk_size:
+            return False
+        self.flush()
+        return True
+
+    def flush(self):
+        """Вставляет накопленное одной транзакцией в порядке зависимостей."""
+        with transaction.atomic(), raw_dates(Post, Comment):
+            for label in self.models:
+                records = self.pending.pop(label, [])
+                if records:
+                    getattr(self, 'load_' + label.split('.')[1])(records)
+        self.pending_count = 0
+
+    def allocate(self, model, count):
+        """Выдаёт count новых id модели подряд после наибольшего в базе."""
+        if model not in self.next_ids:
+            top = model.objects.aggregate(top=Max('pk'))['top']
+            self.next_ids[model] = (top or 0) + 1
+        start = self.next_ids[model]
+        self.next_ids[model] += count
+        return range(start, start + count)
+
+    def insert(self, model, objects, **kwargs):
+        # Django 2.2 не урезает явный batch_size до предела бэкенда,
+        # а SQLite не примет больше 500 строк в одном INSERT.
+        fields = model._meta.concrete_fields
+        batch_size = min(self.batch_size, max(
+            connection.ops.bulk_batch_size(fields, objects), 1))
+        model.objects.bulk_create(objects, batch_size=batch_size, **kwargs)
+
+    def resolve(self, model, pk):
+        return self.ids[model].get(pk)
+
+    def load_natural(self, model, records, key, build):
+        """Строки с естественным ключом: имеющиеся не вставляются."""
+        by_key = {}
+        for record in records:
+            by_key[record['fields'][key]] = record
+        existing = dict(model.objects.filter(
+            **{f'{key}__in': list(by_key)}).values_list(key, 'pk'))
+        new = [record for value, record in by_key.items()
+               if value not in existing]
+        objects = []
+        for record, pk in zip(new, self.allocate(model, len(new))):
+            objects.append(build(pk, record['fields']))
+            existing[record['fields'][key]] = pk
+        self.insert(model, objects)
+        for record in records:
+            self.ids[model][record['pk']] = existing[record['fields'][key]]
+        self.stats[model._meta.label_lower] += len(objects)
+
+    def load_user(self, records):
+        self.load_natural(User, records, 'username', lambda pk, fields: User(
+            pk=pk, **{name: fields[name] for name in USER_FIELDS
+                      if name in fields}))
+
+    def load_group(self, records):
+        self.load_natural(Group, records, 'slug', lambda pk, fields: Group(
+            pk=pk, title=fields['title'], slug=fields['slug'],
+            description=fields.get('description', '')))
+
+    def load_post(self, records):
+        objects = []
+        for record in records:
+            fields = record['fields']
+            author_id = self.resolve(User, fields['author'])
+            group_id = self.resolve(Group, fields.get('group'))
+            if author_id is None or (fields.get('group') and not group_id):
+                self.skipped['posts.post'] += 1
+                continue
+            post = Post(
+                text=fields['text'],
+                pub_date=fields.get('pub_date') or timezone.now(),
+                author_id=author_id, group_id=group_id,
+                image=fields.get('image') or '',
+            )
+            markup.refresh(post)
+            objects.append((record['pk'], post))
+        pks = self.allocate(Post, len(objects))
+        for (source_pk, post), pk in zip(objects, pks):
+            post.pk = pk
+            self.ids[Post][source_pk] = pk
+            self.touched['users'].add(post.author_id)
+            self.touched['authors'].add(post.author_id)
+            self.touched['groups'].add(post.group_id)
+            if post.image:
+                self.touched['images'].add(post.image)
+        self.insert(Post, [post for _, post in objects])
+        self.stats['posts.post'] += len(objects)
+
+    def load_comment(self, records):
+        objects = []
+        for record in records:
+            fields = record['fields']
+            post_id = self.resolve(Post, fields['post'])
+            author_id = self.resolve(User, fields['author'])
+            if post_id is None or author_id is None:
+                self.skipped['posts.comment'] += 1
+                continue
+            objects.append(Comment(
+                post_id=post_id, author_id=author_id,
+                text=fields['text'],
+                created=fields.get('created') or timezone.now(),
+            ))
+            self.touched['posts'].add(post_id)
+        self.insert(Comment, objects)
+        self.stats['posts.comment'] += len(objects)
+
+    def load_follow(self, records):
+        objects = []
+        for record in records:
+            fields = record['fields']
+            user_id = self.resolve(User, fields['user'])
+            author_id = self.resolve(User, fields['author'])
+            if user_id is None or author_id is None:
+                self.skipped['posts.follow'] += 1
+                continue
+            objects.append(Follow(user_id=user_id, author_id=author_id))
+            self.touched['users'].update((user_id, author_id))
+            self.touched['readers'].add(user_id)
+        self.insert(Follow, objects, ignore_conflicts=True)
+        self.stats['posts.follow'] += len(objects)
+
+    def finish(self):
+        """Дописывает остаток и досчитывает то, что делают сигналы."""
+        self.flush()
+        models = [model for model in self.models.values()
+                  if model in self.next_ids]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+        self.recount()
+        readers = set(self.touched['readers'])
+        for authors in in_batches(self.touched['authors'], self.batch_size):
+            readers.update(Follow.objects.filter(
+                author__in=authors).values_list('user_id', flat=True))
+        for users in in_batches(readers, self.batch_size):
+            feed.rebuild(users=users)
+        if self.touched['images']:
+            blobs.recount()
+        if self.rows:
+            page_cache.bump(page_cache.ALL)
+
+    def recount(self):
+        groups = self.touched['groups'] - {None}
+        for pks in in_batches(groups, self.batch_size):
+            Group.objects.filter(pk__in=pks).update(
+                posts_count=counters.count_of(Post, 'group'))
+        for pks in in_batches(self.touched['posts'], self.batch_size):
+            Post.objects.filter(pk__in=pks).update(
+                comments_count=counters.count_of(Comment, 'post'))
+        for pks in in_batches(self.touched['users'], self.batch_size):
+            counters.recount_users(user_ids=pks)
@@ -0,0 +1,40 @@
+"""Имена лент для версионного кэша страниц (см. core.cache)."""
+from core import cache as page_cache
+
+from .models import Group, User
+
+
+def index_feed():
+    return 'index'
+
+
+def group_feed(slug):
+    return f'group:{slug}'
+
+
+def profile_feed(username):
+    return f'profile:{username}'
+
+
+def post_changed(post, *group_ids):
+    """Сбрасывает ленты, в которых показан пост."""
+    feeds = [index_feed(), profile_feed(post.author.username)]
+    group_ids = {pk for pk in group_ids if pk is not None}
+    if group_ids:
+        slugs = Group.objects.filter(
+            pk__in=group_ids).values_list('slug', flat=True)
+        feeds.extend(group_feed(slug) for slug in slugs)
+    page_cache.bump(*feeds)
+
+
+def follow_changed(follow):
+    """Сбрасывает профили обеих сторон: в них кнопка и счётчики."""
+    usernames = User.objects.filter(
+        pk__in=(follow.user_id, follow.author_id)
+    ).values_list('username', flat=True)
+    page_cache.bump(*map(profile_feed, usernames))
+
+
+def everything_changed():
+    """Сбрасывает все ленты сразу: для редких правок групп и имён."""
+    page_cache.bump(page_cache.ALL)
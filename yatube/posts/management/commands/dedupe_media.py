@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import cache as page_cache
+from posts import blobs, fragments, images, thumbnails
+from posts.models import Post, Rendition
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в хранилище по хэшу содержимого, '
+            'удаляя одинаковые файлы')
+
+    def handle(self, *args, **options):
+        storage = images.storage()
+        names = Post.objects.exclude(image='').order_by().values_list(
+            'image', flat=True).distinct()
+        moved = duplicates = missing = freed = 0
+        for name in list(names):
+            if storage.is_content_addressed(name):
+                continue
+            if not storage.exists(name):
+                missing += 1
+                continue
+            size = storage.size(name)
+            with storage.open(name) as original:
+                existed = storage.exists(
+                    storage.content_name(name, original))
+                target = storage.save(name, original)
+            with transaction.atomic():
+                posts = Post.objects.filter(image=name)
+                posts.update(image=target)
+                self.move_renditions(name, target)
+            storage.delete(name)
+            moved += 1
+            if existed:
+                duplicates += 1
+                freed += size
+        blobs.recount()
+        if moved:
+            fragments.bump_versions(Post.objects.exclude(image=''))
+            page_cache.bump(page_cache.ALL)
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено файлов: {moved}, из них дублей: {duplicates} '
+            f'({freed / 2 ** 20:.1f} МБ), не найдено: {missing}'))
+
+    @staticmethod
+    def move_renditions(name, target):
+        """Отдаёт копии и варианты старого файла новому, если их нет."""
+        if Rendition.objects.filter(image=target).exists():
+            Rendition.objects.filter(image=name).delete()
+        else:
+            Rendition.objects.filter(image=name).update(image=target)
+        cache.delete_many([thumbnails.RENDITIONS_PREFIX + name,
+                           thumbnails.RENDITIONS_PREFIX + target])
+        for image_format in settings.POST_IMAGE_VARIANTS:
+            old = images.variant_name(name, image_format)
+            if not default_storage.exists(old):
+                continue
+            new = images.variant_name(target, image_format)
+            if not default_storage.exists(new):
+                with default_storage.open(old) as variant:
+                    default_storage.save(new, variant)
+            default_storage.delete(old)
@@ -0,0 +1,177 @@
+import itertools
+import random
+import time
+from datetime import timedelta
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from posts import images, importer, thumbnails
+
+IMAGE_SIZE = (1200, 800)
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса рангов 1..count по степенному закону."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами с картинками, комментариями и графом подписок')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument(
+            '--follows',
+            type=int,
+            default=20,
+            help='среднее число подписок пользователя',
+        )
+        parser.add_argument(
+            '--exponent',
+            type=float,
+            default=1.1,
+            help='показатель степенного закона популярности авторов',
+        )
+        parser.add_argument(
+            '--images',
+            type=int,
+            default=20,
+            help='число разных картинок на все посты',
+        )
+        parser.add_argument('--image-ratio', type=float, default=0.3)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--chunk-size', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(options['seed'])
+        self.now = timezone.now()
+        # Популярность авторов убывает с рангом, ранги перемешаны.
+        self.authors = list(range(1, options['users'] + 1))
+        self.random.shuffle(self.authors)
+        self.author_weights = zipf_weights(
+            options['users'], options['exponent'])
+        self.post_dates = []
+        pool = self.make_images()
+        loader = importer.Importer(
+            batch_size=options['batch_size'],
+            chunk_size=options['chunk_size'],
+        )
+        for record in itertools.chain(
+                self.users(), self.groups(), self.posts(pool),
+                self.comments(), self.follows()):
+            loader.add(record)
+        loader.finish()
+        started = time.perf_counter()
+        for name in pool:
+            thumbnails.generate(name)
+        for label, count in sorted(loader.stats.items()):
+            self.stdout.write(f'{label}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано строк: {loader.rows}, {loader.rate:.0f} строк/с; '
+            f'копии {len(pool)} картинок за '
+            f'{time.perf_counter() - started:.1f} с'))
+
+    def make_images(self):
+        storage = images.storage()
+        names = []
+        for _ in range(self.options['images']):
+            color = tuple(self.random.randrange(256) for _ in range(3))
+            buffer = BytesIO()
+            Image.new('RGB', IMAGE_SIZE, color).save(buffer, 'PNG')
+            names.append(storage.save(
+                'posts/generated.png', ContentFile(buffer.getvalue())))
+        return names
+
+    def popular_author(self):
+        return self.random.choices(
+            self.authors, cum_weights=self.author_weights)[0]
+
+    def moment(self, since=None):
+        since = since or self.now - timedelta(days=self.options['days'])
+        seconds = (self.now - since).total_seconds()
+        return since + timedelta(seconds=self.random.uniform(0, seconds))
+
+    def users(self):
+        password = make_password(self.options['password'])
+        for pk in range(1, self.options['users'] + 1):
+            yield {'model': 'auth.user', 'pk': pk, 'fields': {
+                'username': f'{self.faker.user_name()}{pk}',
+                'first_name': self.faker.first_name(),
+                'last_name': self.faker.last_name(),
+                'email': self.faker.email(),
+                'password': password,
+                'date_joined': self.moment().isoformat(),
+            }}
+
+    def groups(self):
+        for pk in range(1, self.options['groups'] + 1):
+            yield {'model': 'posts.group', 'pk': pk, 'fields': {
+                'title': self.faker.catch_phrase(),
+                'slug': f'group-{pk}',
+                'description': self.faker.paragraph(),
+            }}
+
+    def posts(self, pool):
+        groups = self.options['groups']
+        for pk in range(1, self.options['posts'] + 1):
+            pub_date = self.moment()
+            self.post_dates.append(pub_date)
+            image = ''
+            if pool and self.random.random() < self.options['image_ratio']:
+                image = self.random.choice(pool)
+            yield {'model': 'posts.post', 'pk': pk, 'fields': {
+                'text': '\n\n'.join(self.faker.paragraphs(
+                    self.random.randint(1, 5))),
+                'pub_date': pub_date.isoformat(),
+                'author': self.popular_author(),
+                'group': self.random.randint(1, groups) if groups else None,
+                'image': image,
+            }}
+
+    def comments(self):
+        if not self.post_dates:
+            return
+        for pk in range(1, self.options['comments'] + 1):
+            post = self.random.randrange(len(self.post_dates))
+            yield {'model': 'posts.comment', 'pk': pk, 'fields': {
+                'post': post + 1,
+                'author': self.random.randint(1, self.options['users']),
+                'text': self.faker.sentence(),
+                'created': self.moment(self.post_dates[post]).isoformat(),
+            }}
+
+    def follows(self):
+        """Подписки: число у читателя и популярность автора — степенные."""
+        users = self.options['users']
+        mean = self.options['follows']
+        # У распределения Парето с alpha = 2 среднее равно 2.
+        for user in range(1, users + 1):
+            count = min(
+                int(self.random.paretovariate(2) * mean / 2), users - 1)
+            authors = set()
+            for _ in range(count * 2):
+                if len(authors) == count:
+                    break
+                author = self.popular_author()
+                if author != user:
+                    authors.add(author)
+            for author in authors:
+                yield {'model': 'posts.follow', 'pk': None, 'fields': {
+                    'user': user, 'author': author}}
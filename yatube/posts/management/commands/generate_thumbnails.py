@@ -0,0 +1,39 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Строит адаптивные копии картинок постов в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=settings.THUMBNAIL_WORKERS,
+        )
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').order_by().values_list(
+            'image', flat=True).distinct()
+        done = failed = 0
+        with ProcessPoolExecutor(
+                max_workers=options['processes'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup) as pool:
+            futures = [pool.submit(thumbnails.generate, name)
+                       for name in names.iterator()]
+            for future in futures:
+                if future.exception() is None:
+                    done += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f'Ошибка: {future.exception()}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок обработано: {done}, с ошибками: {failed}'))
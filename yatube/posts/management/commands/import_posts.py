@@ -0,0 +1,51 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts import importer
+
+
+class Command(BaseCommand):
+    help = ('Потоково загружает пользователей, группы, посты, комментарии '
+            'и подписки из фикстуры JSON или NDJSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл фикстуры или - для stdin')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='строк в одном INSERT',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=20000,
+            help='записей в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        loader = importer.Importer(
+            batch_size=options['batch_size'],
+            chunk_size=options['chunk_size'],
+        )
+        progress = options['verbosity'] > 1
+        if options['path'] == '-':
+            self.load(loader, sys.stdin, progress)
+        else:
+            with open(options['path'], encoding='utf-8') as stream:
+                self.load(loader, stream, progress)
+        for label, count in sorted(loader.stats.items()):
+            self.stdout.write(f'{label}: {count}')
+        for label, count in sorted(loader.skipped.items()):
+            self.stdout.write(f'пропущено {label or "?"}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено строк: {loader.rows}, '
+            f'{loader.rate:.0f} строк/с'))
+
+    def load(self, loader, stream, progress):
+        for record in importer.iter_records(stream):
+            if loader.add(record) and progress:
+                self.stdout.write(
+                    f'{loader.rows} строк, {loader.rate:.0f} строк/с')
+        loader.finish()
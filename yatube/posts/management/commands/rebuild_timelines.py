@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок с нуля'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='users',
+            type=int,
+            help='id читателя; можно указать несколько раз',
+        )
+
+    def handle(self, *args, **options):
+        follows = feed.rebuild(users=options['users'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны, обработано подписок: {follows}'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает «звёзд», чьи посты читаются при выдаче ленты, '
+            'и дозаполняет ленты подписчиков выпавших авторов')
+
+    def handle(self, *args, **options):
+        added, dropped = feed.reclassify()
+        self.stdout.write(self.style.SUCCESS(
+            f'Новых «звёзд»: {len(added)}, выпавших: {len(dropped)}'))
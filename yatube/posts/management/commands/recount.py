@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, комментариев и подписок'
+
+    def handle(self, *args, **options):
+        updated = counters.recount()
+        for name, rows in updated.items():
+            self.stdout.write(f'{name}: {rows}')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
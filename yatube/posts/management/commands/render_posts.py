@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import cache as page_cache
+from posts import markup
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Перерисовывает HTML постов, отрисованных прежней версией '
+            'отрисовщика Markdown')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='перерисовать все посты, а не только устаревшие',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.order_by('pk')
+        if not options['all']:
+            posts = posts.exclude(text_html_version=markup.VERSION)
+        updated = 0
+        last = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last)[:options['batch_size']])
+            if not batch:
+                break
+            last = batch[-1].pk
+            for post in batch:
+                markup.refresh(post)
+            with transaction.atomic():
+                Post.objects.bulk_update(batch, markup.FIELDS)
+            updated += len(batch)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'перерисовано {updated}')
+        if updated:
+            page_cache.bump(page_cache.ALL)
+        self.stdout.write(self.style.SUCCESS(
+            f'Перерисовано постов: {updated}, версия {markup.VERSION}'))
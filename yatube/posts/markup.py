@@ -0,0 +1,155 @@
+"""Отрисовка текста поста из Markdown в HTML.
+
+Поддерживается подмножество Markdown: абзацы с переносами строк,
+заголовки #, цитаты >, списки - * и 1., блоки кода ```, а внутри
+строки `код`, **жирный**, *курсив* и [ссылки](https://...). Текст
+экранируется до разметки, поэтому HTML автора в страницу не попадает,
+а ссылки допускаются только http(s), mailto и относительные.
+
+HTML хранится в Post.text_html вместе с версией отрисовщика. При
+изменении правил отрисовки VERSION увеличивается. Устаревшие посты
+при показе перерисовываются только в памяти, чтобы чтение не писало
+в базу, а сохраняет новый HTML команда render_posts.
+"""
+import re
+
+from django.utils.html import escape
+
+VERSION = 2
+FIELDS = ('text_html', 'text_html_version')
+
+FENCE = re.compile(r'^```')
+HEADING = re.compile(r'^(#{1,6})\s+(.*?)\s*#*$')
+QUOTE = re.compile(r'^>\s?')
+BULLET = re.compile(r'^[-*+]\s+')
+NUMBERED = re.compile(r'^\d{1,9}[.)]\s+')
+TOKEN = re.compile(
+    r'(?P<ticks>`+)(?P<code>.+?)(?P=ticks)'
+    r'|\[(?P<text>[^\]]+)\]\((?P<url>[^)\s]+)\)')
+# Обратную косую черту браузеры читают как прямую: /\evil.com — это
+# //evil.com, поэтому в адресах ссылок она запрещена.
+SAFE_URL = re.compile(r'^(https?://|mailto:|/(?![/\\])|#)[^\\]*$',
+                      re.IGNORECASE)
+STRONG = re.compile(r'(\*\*|__)(?=\S)(.+?)(?<=\S)\1')
+EMPHASIS = re.compile(
+    r'(?<![\w*])\*(?=\S)(.+?)(?<=\S)\*(?!\*)'
+    r'|(?<![\w_])_(?=\S)(.+?)(?<=\S)_(?!\w)')
+# Глубже цитаты не вкладываются, лишние > остаются текстом: каждый
+# уровень — это вызов render, и тысяча > исчерпала бы стек.
+MAX_QUOTE_DEPTH = 8
+
+
+def emphasis(match):
+    return f'<em>{match.group(1) or match.group(2)}</em>'
+
+
+def inline_plain(text):
+    text = STRONG.sub(r'<strong>\2</strong>', escape(text))
+    return EMPHASIS.sub(emphasis, text)
+
+
+def token(match):
+    if match.group('code') is not None:
+        return f'<code>{escape(match.group("code").strip())}</code>'
+    text, url = match.group('text', 'url')
+    if not SAFE_URL.match(url):
+        return inline_plain(match.group(0))
+    return (f'<a href="{escape(url)}" rel="nofollow">'
+            f'{inline_plain(text)}</a>')
+
+
+def inline(text):
+    """Разметка внутри строки; код и адреса ссылок не размечаются."""
+    parts = []
+    position = 0
+    for match in TOKEN.finditer(text):
+        parts.append(inline_plain(text[position:match.start()]))
+        parts.append(token(match))
+        position = match.end()
+    parts.append(inline_plain(text[position:]))
+    return ''.join(parts)
+
+
+def lines_html(lines):
+    return '<br>\n'.join(inline(line) for line in lines)
+
+
+def render_list(lines, pattern, tag):
+    items = []
+    for line in lines:
+        if pattern.match(line):
+            items.append([pattern.sub('', line)])
+        else:
+            items[-1].append(line.strip())
+    body = ''.join(f'<li>{lines_html(item)}</li>' for item in items)
+    return f'<{tag}>{body}</{tag}>'
+
+
+def render_block(lines, depth):
+    html = []
+    for start, line in enumerate(lines):
+        heading = HEADING.match(line)
+        if heading is None:
+            html.append(render_body(lines[start:], depth))
+            break
+        level = len(heading.group(1))
+        html.append(f'<h{level}>{inline(heading.group(2))}</h{level}>')
+    return '\n'.join(html)
+
+
+def render_body(lines, depth):
+    if depth < MAX_QUOTE_DEPTH and all(QUOTE.match(line) for line in lines):
+        quoted = render(
+            '\n'.join(QUOTE.sub('', line) for line in lines), depth + 1)
+        return f'<blockquote>{quoted}</blockquote>'
+    if BULLET.match(lines[0]):
+        return render_list(lines, BULLET, 'ul')
+    if NUMBERED.match(lines[0]):
+        return render_list(lines, NUMBERED, 'ol')
+    return f'<p>{lines_html(lines)}</p>'
+
+
+def blocks(text):
+    """Блоки текста: ('code', строки) или ('text', строки)."""
+    block = []
+    lines = iter(text.replace('\r\n', '\n').replace('\r', '\n').split('\n'))
+    for line in lines:
+        if FENCE.match(line):
+            if block:
+                yield 'text', block
+                block = []
+            code = []
+            for line in lines:
+                if FENCE.match(line):
+                    break
+                code.append(line)
+            yield 'code', code
+        elif line.strip():
+            block.append(line.rstrip())
+        elif block:
+            yield 'text', block
+            block = []
+    if block:
+        yield 'text', block
+
+
+def render(text, depth=0):
+    """HTML поста из Markdown; безопасен для вывода без экранирования."""
+    html = []
+    for kind, lines in blocks(text):
+        if kind == 'code':
+            code = escape('\n'.join(lines))
+            html.append(f'<pre><code>{code}</code></pre>')
+        else:
+            html.append(render_block(lines, depth))
+    return '\n'.join(html)
+
+
+def refresh(post):
+    """Перерисовывает HTML поста текущей версией отрисовщика."""
+    post.text_html = render(post.text)
+    post.text_html_version = VERSION
+
+
+def is_stale(post):
+    return post.text_html_version != VERSION
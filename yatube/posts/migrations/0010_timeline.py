@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Timeline = apps.get_model('posts', 'Timeline')
+    # Подписки до 0012 могут повторяться, поэтому строки лент
+    # отбираются через DISTINCT, иначе сработает unique_timeline_entry.
+    rows = Follow.objects.filter(author__posts__isnull=False).order_by(
+    ).values_list(
+        'user_id', 'author__posts__pk', 'author__posts__pub_date',
+    ).distinct()
+    sql, params = rows.query.sql_with_params()
+    schema_editor.execute(
+        f'{schema_editor.connection.ops.insert_statement()} '
+        f'{Timeline._meta.db_table} (user_id, post_id, pub_date) {sql}',
+        params,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_follow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Timeline',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-pub_date', '-post_id'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timeline',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timeline',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_celebrities(apps, schema_editor):
+    # Прежде «звёзды» определялись по порогу при каждом обращении.
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.filter(
+        followers_count__gte=settings.FEED_CELEBRITY_THRESHOLD,
+    ).update(pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_comment_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='pulled',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(mark_celebrities, migrations.RunPython.noop),
+    ]
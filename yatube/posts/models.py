@@ -1,5 +1,11 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.utils.safestring import mark_safe
+
+from core.storage import ContentAddressedStorage
+
+from . import markup
 
 
 User = get_user_model()
@@ -9,6 +15,7 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=255, unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.title
@@ -40,16 +47,36 @@ class Post(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    version = models.PositiveIntegerField(default=1, editable=False)
+    text_html = models.TextField(blank=True, editable=False)
+    text_html_version = models.PositiveSmallIntegerField(
+        default=0, editable=False)
 
     class Meta:
         ordering = ('-pub_date',)
         default_related_name = 'posts'
+        indexes = [
+            models.Index(fields=('pub_date',), name='post_date_idx'),
+            models.Index(
+                fields=('group', 'pub_date'), name='post_group_date_idx'),
+            models.Index(
+                fields=('author', 'pub_date'), name='post_author_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def html(self):
+        """Отрисованный текст; устаревший перерисовывается на лету."""
+        if markup.is_stale(self):
+            markup.refresh(self)
+        return mark_safe(self.text_html)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -65,6 +92,14 @@ class Comment(models.Model):
     text = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=('post', 'created', 'id'),
+                name='comment_post_created_id_idx',
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -77,3 +112,126 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='following',
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'author'), name='unique_follow'),
+        ]
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0, db_index=True)
+    following_count = models.PositiveIntegerField(default=0)
+    # Посты «звезды» не раскладываются по лентам, а читаются при выдаче.
+    pulled = models.BooleanField(default=False, db_index=True)
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок: пост в ленте читателя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ('-pub_date', '-post_id')
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='unique_timeline_entry',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_date_idx',
+            ),
+        ]
+
+
+class Rendition(models.Model):
+    """Уменьшенная копия картинки поста с именем по хэшу содержимого."""
+    image = models.CharField(max_length=100)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)
+    file = models.CharField(max_length=100)
+
+    class Meta:
+        ordering = ('image', 'format', 'width')
+        constraints = [
+            models.UniqueConstraint(
+                fields=('image', 'format', 'width'),
+                name='unique_rendition',
+            ),
+        ]
+
+    def __str__(self):
+        return self.file
+
+    @property
+    def url(self):
+        return default_storage.url(self.file)
+
+
+class ImageBlob(models.Model):
+    """Число постов, ссылающихся на файл картинки."""
+    name = models.CharField(max_length=100, primary_key=True)
+    references = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class Match(models.Lookup):
+    """Условие полнотекстового поиска FTS5: «колонка MATCH запрос»."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class SearchTextField(models.TextField):
+    """Колонка виртуальной таблицы FTS5."""
+
+
+SearchTextField.register_lookup(Match)
+
+
+class PostSearch(models.Model):
+    """Строка полнотекстового индекса постов (таблица FTS5).
+
+    Таблицу и триггеры, синхронизирующие её с posts_post, создаёт
+    posts.search; rank — встроенная оценка bm25, меньше — лучше.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        related_name='+',
+    )
+    text = SearchTextField()
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'posts_post_fts'
@@ -0,0 +1,145 @@
+"""Полнотекстовый поиск постов на SQLite FTS5.
+
+Индекс — внешняя по содержимому таблица FTS5 над posts_post: текст
+в ней не дублируется, а триггеры на вставку, удаление и изменение
+текста поддерживают её в актуальном состоянии при любой записи,
+включая queryset.update() и bulk_create(). SQLite удаляет триггеры,
+когда миграции пересоздают таблицу постов, поэтому install() снова
+вызывается после каждого migrate.
+
+Слова запроса ищутся по префиксу (для русских окончаний это лучше
+точного совпадения), выдача сортируется по bm25 и листается курсором
+по паре (оценка, id).
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from .models import Post, PostSearch
+from .utils import CURSOR_SEPARATOR, KeysetPaginator
+
+TABLE = PostSearch._meta.db_table
+SOURCE = Post._meta.db_table
+SEARCH_FIELDS = ('rank', 'post_id')
+WORD = re.compile(r'\w+')
+
+CREATE_TABLE = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5('
+    f"text, content='{SOURCE}', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+TRIGGERS = (
+    f'CREATE TRIGGER IF NOT EXISTS {TABLE}_ai AFTER INSERT ON {SOURCE} '
+    f'BEGIN INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text); END',
+    f'CREATE TRIGGER IF NOT EXISTS {TABLE}_ad AFTER DELETE ON {SOURCE} '
+    f"BEGIN INSERT INTO {TABLE}({TABLE}, rowid, text) "
+    f"VALUES ('delete', old.id, old.text); END",
+    f'CREATE TRIGGER IF NOT EXISTS {TABLE}_au AFTER UPDATE OF text '
+    f'ON {SOURCE} BEGIN '
+    f"INSERT INTO {TABLE}({TABLE}, rowid, text) "
+    f"VALUES ('delete', old.id, old.text); "
+    f'INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text); END',
+)
+
+
+def supported(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def install(using=connection):
+    """Создаёт таблицу индекса и триггеры, если их ещё нет."""
+    if not supported(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        for statement in TRIGGERS:
+            cursor.execute(statement)
+
+
+def uninstall(using=connection):
+    if not supported(using):
+        return
+    with using.cursor() as cursor:
+        for suffix in ('ai', 'ad', 'au'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {TABLE}_{suffix}')
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+def rebuild(using=connection):
+    """Заново строит индекс по текущему содержимому posts_post."""
+    install(using)
+    if not supported(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')")
+
+
+def build_query(text):
+    """Запрос FTS5 из пользовательского ввода: все слова по префиксу.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 во вводе
+    не действуют и не ломают разбор.
+    """
+    words = WORD.findall(text.lower())[:settings.SEARCH_MAX_WORDS]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def matching(text):
+    """Строки индекса, подходящие под запрос, с постами и авторами."""
+    return PostSearch.objects.filter(
+        text__match=build_query(text)
+    ).select_related('post__author', 'post__group').order_by(*SEARCH_FIELDS)
+
+
+def post_ids(text):
+    """Подзапрос id постов для фильтра pk__in, например в админке."""
+    query = build_query(text)
+    if not query or not supported():
+        return Post.objects.filter(text__icontains=text).values('pk')
+    return PostSearch.objects.filter(text__match=query).values('post_id')
+
+
+def encode_rank_cursor(rank, pk):
+    raw = f'{rank!r}{CURSOR_SEPARATOR}{pk}'
+    return urlsafe_base64_encode(force_bytes(raw))
+
+
+def decode_rank_cursor(token):
+    if not token:
+        return None
+    try:
+        rank, pk = force_str(
+            urlsafe_base64_decode(token)).split(CURSOR_SEPARATOR)
+        return float(rank), int(pk)
+    except ValueError:
+        return None
+
+
+class SearchPaginator(KeysetPaginator):
+    """Курсорный пагинатор выдачи по (оценка bm25, id)."""
+    decode = staticmethod(decode_rank_cursor)
+
+    def __init__(self, object_list, per_page, after=None, before=None):
+        super().__init__(object_list, per_page, fields=SEARCH_FIELDS,
+                         after=after, before=before, descending=False)
+
+    def cursor(self, obj):
+        return encode_rank_cursor(obj.rank, obj.post_id)
+
+
+def get_page(request, text):
+    """Страница выдачи; в page_obj лежат посты, а не строки индекса."""
+    paginator = SearchPaginator(
+        matching(text),
+        settings.POSTS_ON_PAGE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    page_obj = paginator.get_page()
+    for entry in page_obj.object_list:
+        entry.post.rank = entry.rank
+    page_obj.object_list = [entry.post for entry in page_obj.object_list]
+    return page_obj
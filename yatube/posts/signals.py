@@ -0,0 +1,111 @@
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_save)
+from django.dispatch import receiver
+
+from . import (
+    blobs, counters, feed, fragments, invalidation, markup, thumbnails)
+from .models import Comment, Follow, Group, Post, User
+
+USER_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def user_names(user):
+    return tuple(getattr(user, field) for field in USER_NAME_FIELDS)
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    instance._counted_group_id = instance.group_id
+    instance._saved_image = instance.image.name or ''
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw, **kwargs):
+    # Ленты выводят готовый HTML, а не размечают текст при каждом показе.
+    if not raw:
+        markup.refresh(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        feed.fan_out(instance)
+        counters.bump_user(instance.author_id, posts_count=1)
+        counters.bump_group(instance.group_id, 1)
+    else:
+        fragments.bump_versions(Post.objects.filter(pk=instance.pk))
+        if instance.group_id != instance._counted_group_id:
+            counters.bump_group(instance._counted_group_id, -1)
+            counters.bump_group(instance.group_id, 1)
+    invalidation.post_changed(
+        instance, instance.group_id, instance._counted_group_id)
+    instance._counted_group_id = instance.group_id
+    image = instance.image.name or ''
+    if created or image != instance._saved_image:
+        blobs.acquire(image)
+        if not created:
+            blobs.release(instance._saved_image)
+        if image and not thumbnails.lookup(image):
+            thumbnails.schedule(image)
+    instance._saved_image = image
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, posts_count=-1)
+    counters.bump_group(instance.group_id, -1)
+    blobs.release(instance.image.name)
+    invalidation.post_changed(instance, instance.group_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        counters.bump_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        feed.backfill(instance.user_id, instance.author_id)
+        counters.bump_user(instance.user_id, following_count=1)
+        counters.bump_user(instance.author_id, followers_count=1)
+        invalidation.follow_changed(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    feed.prune(instance.user_id, instance.author_id)
+    counters.bump_user(instance.user_id, following_count=-1)
+    counters.bump_user(instance.author_id, followers_count=-1)
+    invalidation.follow_changed(instance)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidation.everything_changed()
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    instance._cached_names = user_names(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw, **kwargs):
+    # Вход обновляет last_login; ленты сбрасываем, только если
+    # поменялось что-то из показываемого в них.
+    if not created and not raw and (
+            user_names(instance) != instance._cached_names):
+        fragments.bump_versions(Post.objects.filter(author=instance))
+        invalidation.everything_changed()
+    instance._cached_names = user_names(instance)
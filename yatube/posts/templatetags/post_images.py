@@ -0,0 +1,47 @@
+from django import template
+from django.conf import settings
+
+from posts import thumbnails
+
+register = template.Library()
+
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+    'AVIF': 'image/avif',
+}
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(post, sizes=None):
+    """Картинка поста со srcset по готовым копиям или заглушка."""
+    renditions = getattr(post, 'renditions', None)
+    if renditions is None and post.image:
+        renditions = thumbnails.lookup(post.image.name)
+    by_format = {}
+    for rendition in renditions or ():
+        by_format.setdefault(rendition.format, []).append(rendition)
+    fallback = by_format.pop('JPEG', [])
+    sources = [
+        (MIME_TYPES.get(image_format, ''), srcset(variants))
+        for image_format, variants in by_format.items()
+    ]
+    # В src — копия, ближайшая к ширине карточки, для браузеров без srcset.
+    src = min(
+        fallback,
+        key=lambda rendition: abs(
+            rendition.width - settings.POST_RENDITION_DEFAULT_WIDTH),
+        default=None,
+    )
+    return {
+        'has_image': bool(post.image),
+        'src': src,
+        'srcset': srcset(fallback),
+        'sources': sources,
+        'sizes': sizes or settings.POST_IMAGE_SIZES,
+    }
+
+
+def srcset(renditions):
+    return ', '.join(
+        f'{rendition.url} {rendition.width}w' for rendition in renditions)
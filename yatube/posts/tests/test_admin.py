@@ -0,0 +1,81 @@
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.utils import EstimatedCountPaginator, estimate_count
+
+CHANGELISTS = (
+    'admin:posts_post_changelist',
+    'admin:posts_comment_changelist',
+    'admin:posts_follow_changelist',
+)
+
+
+class AdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        start = User.objects.count()
+        for i in range(start, start + count):
+            author = User.objects.create_user(username=f'author{i}')
+            post = Post.objects.create(
+                author=author, group=self.group, text=f'Пост {i}')
+            Comment.objects.create(post=post, author=self.admin, text='ок')
+            Follow.objects.create(user=self.admin, author=author)
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(url))
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_changelist_queries_do_not_grow(self):
+        """Число запросов списка не зависит от числа строк."""
+        self.add_rows(1)
+        before = {url: self.queries(url) for url in CHANGELISTS}
+        self.add_rows(5)
+        for url in CHANGELISTS:
+            with self.subTest(url=url):
+                self.assertEqual(self.queries(url), before[url])
+
+    def test_forms_do_not_list_related_rows(self):
+        """Формы не выводят все посты и всех пользователей списком."""
+        self.add_rows(2)
+        post = Post.objects.first()
+        for url in ('admin:posts_comment_add', 'admin:posts_follow_add',
+                    'admin:posts_post_add'):
+            with self.subTest(url=url):
+                response = self.client.get(reverse(url))
+                self.assertNotContains(
+                    response, f'<option value="{self.admin.pk}"')
+                self.assertNotContains(
+                    response, f'<option value="{post.pk}"')
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=3)
+    def test_count_is_estimated(self):
+        """Вся таблица считается по статистике, выборка — до предела."""
+        self.add_rows(5)
+        self.assertIsNone(estimate_count(Post))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimate_count(Post), 5)
+        Post.objects.filter(pk=Post.objects.first().pk).delete()
+        paginator = EstimatedCountPaginator(Post.objects.all(), 2)
+        self.assertEqual(paginator.count, 5)
+        filtered = Post.objects.filter(group=self.group)
+        self.assertEqual(
+            EstimatedCountPaginator(filtered, 2).count, 3)
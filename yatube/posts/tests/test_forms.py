@@ -1,12 +1,16 @@
+import hashlib
 import shutil
 import tempfile
 from http import HTTPStatus
+from io import BytesIO
 
 from django.conf import settings
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
+from posts.forms import PostForm
 from posts.models import Group, Post, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -74,7 +78,8 @@ class PostFormTests(TestCase):
         self.assertEqual(new_post.text, form_data['text'])
         self.assertEqual(new_post.author, self.user)
         self.assertEqual(new_post.group.pk, form_data['group'])
-        self.assertEqual(new_post.image, f'posts/{uploaded.name}')
+        digest = hashlib.sha256(small_gif).hexdigest()
+        self.assertEqual(new_post.image, f'posts/{digest[:2]}/{digest}.gif')
 
     def test_edit_post(self):
         """происходит изменение поста"""
@@ -108,3 +113,36 @@ class PostFormTests(TestCase):
         self.assertEqual(edited_post.group.pk, form_data['group'])
         self.assertEqual(
             old_group_response.context['page_obj'].paginator.count, 0)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageNormalizationTests(TestCase):
+    @staticmethod
+    def make_jpeg(size, **options):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG', **options)
+        return SimpleUploadedFile(
+            'photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def clean(self, upload):
+        form = PostForm(data={'text': 'Текст'}, files={'image': upload})
+        form.is_valid()
+        return form
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_large_photo_downscaled_without_exif(self):
+        """Большое фото уменьшается и теряет EXIF, имя сохраняется."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        form = self.clean(self.make_jpeg((400, 200), exif=exif.tobytes()))
+        image = form.cleaned_data['image']
+        self.assertEqual(image.name, 'photo.jpg')
+        with Image.open(image) as normalized:
+            self.assertEqual(normalized.size, (50, 100))
+            self.assertNotIn('exif', normalized.info)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_pixel_limit(self):
+        """Слишком большая по пикселям картинка отклоняется."""
+        form = self.clean(self.make_jpeg((20, 20)))
+        self.assertIn('image', form.errors)
@@ -0,0 +1,117 @@
+import json
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+
+from posts.importer import iter_records
+from posts.models import (
+    Comment, Follow, Group, ImageBlob, Post, Rendition, Timeline, User,
+)
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+FIXTURE = [
+    {'model': 'auth.user', 'pk': 7, 'fields': {
+        'username': 'leo', 'password': '!', 'first_name': 'Лев'}},
+    {'model': 'auth.user', 'pk': 8, 'fields': {
+        'username': 'reader', 'password': '!'}},
+    {'model': 'posts.group', 'pk': 3, 'fields': {
+        'title': 'Дневники', 'slug': 'diaries', 'description': ''}},
+    {'model': 'posts.post', 'pk': 5, 'fields': {
+        'text': 'Начинаю новую тетрадь', 'author': 7, 'group': 3,
+        'pub_date': '1854-03-14T00:00:00Z'}},
+    {'model': 'posts.post', 'pk': 6, 'fields': {
+        'text': 'Без автора', 'author': 99,
+        'pub_date': '1854-03-15T00:00:00Z'}},
+    {'model': 'posts.comment', 'pk': 1, 'fields': {
+        'post': 5, 'author': 8, 'text': 'Прочёл',
+        'created': '1854-03-16T00:00:00Z'}},
+    {'model': 'posts.follow', 'pk': 1, 'fields': {'user': 8, 'author': 7}},
+    {'model': 'sessions.session', 'pk': 'x', 'fields': {}},
+]
+
+
+class ImportPostsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Занимаем id, чтобы id из фикстуры не совпали с id в базе.
+        cls.user = User.objects.create_user(username='NoName')
+        Post.objects.create(author=cls.user, text='Старый пост')
+
+    def import_fixture(self, text, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as fixture:
+            fixture.write(text)
+            fixture.flush()
+            out = StringIO()
+            call_command('import_posts', fixture.name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_iter_records_streams_array_and_ndjson(self):
+        """Записи читаются и из массива, и построчно, мелкими кусками."""
+        for text in (json.dumps(FIXTURE, ensure_ascii=False, indent=4),
+                     '\n'.join(json.dumps(record) for record in FIXTURE)):
+            with self.subTest(text=text[:10]):
+                self.assertEqual(
+                    list(iter_records(StringIO(text), size=7)), FIXTURE)
+
+    def test_import_resolves_keys_and_side_effects(self):
+        output = self.import_fixture(json.dumps(FIXTURE), '--chunk-size=3')
+        self.assertIn('пропущено posts.post: 1', output)
+        self.assertIn('пропущено sessions.session: 1', output)
+        leo = User.objects.get(username='leo')
+        reader = User.objects.get(username='reader')
+        group = Group.objects.get(slug='diaries')
+        post = Post.objects.get(text='Начинаю новую тетрадь')
+        self.assertEqual((post.author, post.group), (leo, group))
+        self.assertEqual(post.pub_date.year, 1854)
+        comment = Comment.objects.get(post=post)
+        self.assertEqual((comment.author, comment.created.day), (reader, 16))
+        self.assertTrue(Follow.objects.filter(user=reader, author=leo))
+        self.assertTrue(Timeline.objects.filter(user=reader, post=post))
+        post.refresh_from_db()
+        group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(group.posts_count, 1)
+        self.assertEqual(leo.stats.posts_count, 1)
+        self.assertEqual(reader.stats.following_count, 1)
+        created = Post.objects.create(author=leo, text='Новый пост')
+        self.assertGreater(created.pk, post.pk)
+
+    def test_repeated_import_reuses_users_and_groups(self):
+        self.import_fixture(json.dumps(FIXTURE))
+        self.import_fixture(json.dumps(FIXTURE))
+        self.assertEqual(User.objects.filter(username='leo').count(), 1)
+        self.assertEqual(Group.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(
+            Post.objects.filter(text='Начинаю новую тетрадь').count(), 2)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GenerateDataTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_generate_data(self):
+        call_command(
+            'generate_data', users=30, groups=3, posts=60, comments=40,
+            follows=5, images=2, image_ratio=0.5, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(Comment.objects.count(), 40)
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+        self.assertTrue(Timeline.objects.exists())
+        names = set(Post.objects.exclude(image='').values_list(
+            'image', flat=True))
+        self.assertLessEqual(len(names), 2)
+        self.assertEqual(
+            sum(ImageBlob.objects.values_list('references', flat=True)),
+            Post.objects.exclude(image='').count())
+        self.assertTrue(Rendition.objects.filter(image__in=names).exists())
@@ -0,0 +1,98 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from posts import markup
+from posts.models import Post, User
+
+
+class RenderTest(SimpleTestCase):
+    def test_markdown_subset(self):
+        html = markup.render(
+            '# Заголовок\nпервая *строка*\nвторая **жирная** `a<b`\n\n'
+            '- раз\n- два\n\n```\n<b>код</b>\n```')
+        self.assertHTMLEqual(html, (
+            '<h1>Заголовок</h1>'
+            '<p>первая <em>строка</em><br>'
+            'вторая <strong>жирная</strong> <code>a&lt;b</code></p>'
+            '<ul><li>раз</li><li>два</li></ul>'
+            '<pre><code>&lt;b&gt;код&lt;/b&gt;</code></pre>'))
+
+    def test_html_is_escaped(self):
+        html = markup.render('<script>alert(1)</script> <b onclick="x">')
+        self.assertNotIn('<script', html)
+        self.assertNotIn('<b ', html)
+
+    def test_only_safe_links(self):
+        html = markup.render(
+            '[сайт](https://example.com/?a=1&b="2") '
+            '[плохая](javascript:alert(1))')
+        self.assertIn(
+            '<a href="https://example.com/?a=1&amp;b=&quot;2&quot;" '
+            'rel="nofollow">сайт</a>', html)
+        self.assertNotIn('href="javascript', html)
+
+    def test_backslash_links_are_rejected(self):
+        """/\\host браузер откроет как //host на чужом сайте."""
+        for url in ('/\\evil.com', '/\\/evil.com', '//evil.com',
+                    'https://example.com\\@evil.com'):
+            with self.subTest(url=url):
+                self.assertNotIn('<a ', markup.render(f'[x]({url})'))
+        self.assertIn('href="/group/"', markup.render('[x](/group/)'))
+
+    def test_deep_nesting(self):
+        """Тысячи > и заголовков подряд не исчерпывают стек."""
+        html = markup.render('>' * 2000 + ' текст')
+        self.assertEqual(
+            html.count('<blockquote>'), markup.MAX_QUOTE_DEPTH)
+        self.assertIn('&gt;' * (2000 - markup.MAX_QUOTE_DEPTH), html)
+        html = markup.render('# заголовок\n' * 2000)
+        self.assertEqual(html.count('<h1>'), 2000)
+
+
+class StoredHtmlTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_html_is_rendered_on_save(self):
+        post = Post.objects.create(author=self.user, text='**важно**')
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, '<p><strong>важно</strong></p>')
+        self.assertEqual(post.text_html_version, markup.VERSION)
+        post.text = '*правка*'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, '<p><em>правка</em></p>')
+
+    @override_settings(DEBUG=True)
+    def test_stale_html_is_rerendered_on_show(self):
+        """Устаревший HTML перерисовывается при показе без записи."""
+        post = Post.objects.create(author=self.user, text='**старый**')
+        Post.objects.filter(pk=post.pk).update(
+            text_html='<p>прежний</p>', text_html_version=0)
+        for url in (reverse('posts:index'),
+                    reverse('posts:post_detail', args=[post.pk])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, '<strong>старый</strong>')
+        post.refresh_from_db()
+        self.assertEqual(post.text_html_version, 0)
+
+    def test_render_posts_command(self):
+        post = Post.objects.create(author=self.user, text='**текст**')
+        Post.objects.filter(pk=post.pk).update(
+            text_html='', text_html_version=0)
+        out = StringIO()
+        call_command('render_posts', stdout=out)
+        self.assertIn('Перерисовано постов: 1', out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, '<p><strong>текст</strong></p>')
+        call_command('render_posts', stdout=out)
+        self.assertIn('Перерисовано постов: 0', out.getvalue())
@@ -0,0 +1,82 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.utils import encode_cursor
+
+
+def is_slow(step):
+    """Полный проход по таблице или сортировка во временном B-дереве."""
+    return (step.startswith('SCAN') and ' USING ' not in step
+            or 'TEMP B-TREE' in step)
+
+
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.author = User.objects.create_user(username='SomeName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Тестовый пост')
+        Comment.objects.create(
+            post=cls.post, author=cls.user, text='комментарий')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def capture_selects(self, url):
+        queries = []
+
+        def collect(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(collect):
+            self.authorized_client.get(url)
+        return queries
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_views_use_indexes(self):
+        """Запросы лент не сканируют таблицы и не сортируют вручную."""
+        after = '?after=' + encode_cursor(self.post.pub_date, self.post.pk)
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls + [url + after for url in urls]:
+            self.assertUsesIndexes(url)
+
+    def test_comment_pages_use_indexes(self):
+        """Порции комментариев в обоих порядках идут по индексу."""
+        comment = self.post.comments.get()
+        after = encode_cursor(comment.created, comment.pk)
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        for order in ('newest', 'oldest'):
+            self.assertUsesIndexes(f'{url}?order={order}')
+            self.assertUsesIndexes(f'{url}?order={order}&after={after}')
+
+    def assertUsesIndexes(self, url):
+        for sql, params in self.capture_selects(url):
+            plan = self.explain(sql, params)
+            with self.subTest(url=url, sql=sql):
+                self.assertFalse(
+                    [step for step in plan if is_slow(step)], plan)
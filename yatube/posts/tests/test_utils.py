@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Post, User
+from posts.utils import KeysetPaginator, decode_cursor, encode_cursor
+
+POSTS_COUNT = settings.POSTS_ON_PAGE * 2 + 5
+
+
+class KeysetPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'текст {i}')
+            for i in range(POSTS_COUNT)
+        )
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+
+    def test_cursor_round_trip(self):
+        """Токен курсора распаковывается в исходный ключ."""
+        post = Post.objects.first()
+        token = encode_cursor(post.pub_date, post.pk)
+        self.assertEqual(decode_cursor(token), (post.pub_date, post.pk))
+        self.assertIsNone(decode_cursor('мусор'))
+
+    def test_walk_all_pages_forward_and_back(self):
+        """По курсорам проходятся все посты без повторов и пропусков."""
+        expected = list(
+            Post.objects.order_by('-pub_date', '-pk')
+            .values_list('pk', flat=True)
+        )
+        seen = []
+        pages = []
+        after = None
+        while True:
+            page = KeysetPaginator(
+                Post.objects.all(), settings.POSTS_ON_PAGE, after=after
+            ).get_page()
+            self.assertIs(type(page), Page)
+            pages.append([post.pk for post in page])
+            seen.extend(pages[-1])
+            if not page.has_next():
+                break
+            after = page.paginator.next_cursor
+        self.assertEqual(seen, expected)
+        back = KeysetPaginator(
+            Post.objects.all(), settings.POSTS_ON_PAGE,
+            before=page.paginator.previous_cursor,
+        ).get_page()
+        self.assertEqual([post.pk for post in back], pages[-2])
+
+    def test_bad_cursor_shows_first_page(self):
+        """Битый курсор в запросе приводит на первую страницу."""
+        response = self.client.get(reverse('posts:index') + '?after=xyz')
+        page = response.context['page_obj']
+        self.assertFalse(page.has_previous())
+        self.assertEqual(len(page), settings.POSTS_ON_PAGE)
+
+    def test_first_page_skips_count_query(self):
+        """Курсорная страница обходится без COUNT(*)."""
+        with self.assertNumQueries(1):
+            page = KeysetPaginator(
+                Post.objects.all(), settings.POSTS_ON_PAGE).get_page()
+            self.assertTrue(page.has_next())
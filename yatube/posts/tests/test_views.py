@@ -1,11 +1,29 @@
-from django.test import Client, TestCase
+import os
+import shutil
+import tempfile
+import warnings
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.paginator import UnorderedObjectListWarning
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
 from django import forms
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
 
-from posts.models import Comment, Follow, Group, Post, User
+from core import cache as page_cache
+from core.query_budget import QueryBudgetTestMixin
+from posts import (
+    blobs, feed, fragments, invalidation, search, thumbnails,
+)
+from posts.models import (
+    Comment, Follow, Group, ImageBlob, Post, Rendition, Timeline, User,
+)
+from posts.views import follow_index
 
 POSTS_ON_SECOND_PAGE = 3
 SUM_PAGES = settings.POSTS_ON_PAGE + POSTS_ON_SECOND_PAGE
@@ -235,19 +253,39 @@ class PostPagesTests(TestCase):
                          comments_count + 1)
 
     def test_cache_index_page(self):
-        """Главная страница кэшируется."""
+        """Главная страница кэшируется до изменения ленты."""
         new_post = Post.objects.create(
             author=self.user,
             text='Новый тестовый пост',
             group=self.group,
         )
         response_1 = self.authorized_client.get(reverse('posts:index'))
-        new_post.delete()
+        Post.objects.filter(pk=new_post.pk).update(text='Без сигналов')
         response_2 = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(response_2.content, response_1.content)
-        cache.clear()
+        new_post.delete()
         response_3 = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(response_3.content, response_2.content)
+        self.assertNotIn(new_post, response_3.context['page_obj'])
+
+    def test_cache_invalidated_precisely(self):
+        """Пост в одной группе не сбрасывает кэш другой группы."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group2.slug})
+        response_1 = self.authorized_client.get(url)
+        Post.objects.create(
+            author=self.user, text='Пост в первой группе', group=self.group)
+        response_2 = self.authorized_client.get(url)
+        self.assertIsNone(response_2.context)
+        self.assertEqual(response_2.content, response_1.content)
+
+    def test_cache_varies_by_user(self):
+        """Кэш страницы не отдаёт одному пользователю кнопки другого."""
+        url = reverse('posts:profile', kwargs={'username': self.user2})
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.user2}))
+        followed = self.authorized_client.get(url)
+        response = Client().get(url)
+        self.assertNotEqual(response.content, followed.content)
 
     def test_user_can_follow_author(self):
         """Авторизованный пользователь может
@@ -279,3 +317,499 @@ class PostPagesTests(TestCase):
             response.context['page_obj'][0].author,
             self.user2
         )
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.author = User.objects.create_user(username='SomeName')
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Старый пост',
+        )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def feed_posts(self):
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка дозаполняет ленту, отписка её очищает."""
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}))
+        new_post = Post.objects.create(author=self.author, text='Новый')
+        self.assertEqual(self.feed_posts(), [new_post, self.post])
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.author}))
+        self.assertEqual(self.feed_posts(), [])
+        self.assertFalse(Timeline.objects.filter(user=self.user).exists())
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=2)
+    def test_celebrity_posts_are_pulled(self):
+        """Посты «звезды» не раскладываются, но попадают в ленту."""
+        fan = User.objects.create_user(username='Fan')
+        celebrity = User.objects.create_user(username='Celebrity')
+        Follow.objects.create(user=fan, author=celebrity)
+        Follow.objects.create(user=self.user, author=celebrity)
+        Follow.objects.create(user=self.user, author=self.author)
+        call_command('reclassify_celebrities', stdout=StringIO())
+        pulled = Post.objects.create(author=celebrity, text='Звезда')
+        pushed = Post.objects.create(author=self.author, text='Обычный')
+        self.assertFalse(Timeline.objects.filter(post=pulled).exists())
+        merges = feed.merge_stats['merges']
+        self.assertEqual(self.feed_posts(), [pushed, pulled, self.post])
+        self.assertEqual(feed.merge_stats['merges'], merges + 1)
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=2)
+    def test_dropped_celebrity_is_pushed_by_command(self):
+        """Выпавшей «звезде» ленты дозаполняет команда, а не чтение."""
+        fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=fan, author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(feed.reclassify(), ([self.author.pk], []))
+        post = Post.objects.create(author=self.author, text='Звезда')
+        Follow.objects.filter(user=fan).delete()
+        cache.clear()
+        self.assertIn(self.author.pk, feed.celebrities())
+        self.assertFalse(Timeline.objects.filter(post=post).exists())
+        out = StringIO()
+        call_command('reclassify_celebrities', stdout=out)
+        self.assertIn('выпавших: 1', out.getvalue())
+        self.assertNotIn(self.author.pk, feed.celebrities())
+        self.assertEqual(self.feed_posts(), [post, self.post])
+
+    def test_fan_out_to_many_followers(self):
+        """Раскладка не упирается в предел параметров запроса SQLite."""
+        User.objects.bulk_create(
+            User(username=f'reader{i}') for i in range(1000))
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=self.author)
+            for reader in User.objects.filter(username__startswith='reader'))
+        post = Post.objects.create(author=self.author, text='Всем')
+        self.assertEqual(Timeline.objects.filter(post=post).count(), 1000)
+
+    def test_rebuild_timelines_command(self):
+        """Команда rebuild_timelines восстанавливает ленты."""
+        Follow.objects.create(user=self.user, author=self.author)
+        Timeline.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.feed_posts(), [self.post])
+
+
+class QueryBudgetTest(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        authors = [
+            User.objects.create_user(username=f'author{i}')
+            for i in range(3)
+        ]
+        for author in authors:
+            Follow.objects.create(user=cls.user, author=author)
+            for i in range(settings.POSTS_ON_PAGE):
+                Post.objects.create(
+                    author=author, group=cls.group, text=f'пост {i}',
+                    image=f'posts/{author.username}-{i}.gif')
+        cls.post = Post.objects.first()
+        for author in authors:
+            Comment.objects.create(
+                post=cls.post, author=author, text='комментарий')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def test_views_fit_query_budget(self):
+        """Число запросов не зависит от количества постов на странице."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.post.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                self.assertWithinQueryBudget(self.authorized_client, url)
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=1, DEBUG=True)
+    def test_follow_index_budget_with_many_celebrities(self):
+        """Число запросов ленты не растёт с числом «звёзд» в подписках."""
+        for i in range(follow_index.query_budget + 1):
+            star = User.objects.create_user(username=f'star{i}')
+            Follow.objects.create(user=self.user, author=star)
+            Post.objects.create(author=star, text=f'звезда {i}')
+        feed.reclassify()
+        cache.clear()
+        response = self.assertWithinQueryBudget(
+            self.authorized_client, reverse('posts:follow_index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len(response.context['page_obj']), settings.POSTS_ON_PAGE)
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=1)
+    def test_stale_html_fits_query_budget(self):
+        """Посты прежней версии отрисовщика не пишутся при чтении."""
+        feed.reclassify()
+        Post.objects.update(text_html_version=0)
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                self.assertWithinQueryBudget(self.authorized_client, url)
+        self.assertFalse(
+            Post.objects.exclude(text_html_version=0).exists())
+
+
+class FragmentCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fragments_reused_and_bumped_on_edit(self):
+        """Карточка поста берётся из кэша, а правка её обновляет."""
+        post = Post.objects.get(pk=self.post.pk)
+        fragments.attach_fragments([post])
+        cache.set(fragments.fragment_key(post), 'из кэша')
+        post = Post.objects.get(pk=self.post.pk)
+        fragments.attach_fragments([post])
+        self.assertEqual(post.fragment, 'из кэша')
+        post.text = 'Исправленный пост'
+        post.save()
+        response = Client().get(reverse('posts:index'))
+        self.assertContains(response, 'Исправленный пост')
+
+    def test_author_rename_bumps_fragments(self):
+        """Смена имени автора обновляет карточки его постов."""
+        version = Post.objects.get(pk=self.post.pk).version
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Лев'
+        user.save()
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).version, version + 1)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def assertNotModifiedUntil(self, url, change):
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_feed_not_modified_until_new_post(self):
+        """Лента отдаёт 304, пока в ней не появится новый пост."""
+        self.assertNotModifiedUntil(
+            reverse('posts:index'),
+            lambda: Post.objects.create(author=self.user, text='Ещё пост'),
+        )
+
+    def test_stale_feed_keeps_its_etag(self):
+        """Устаревшая копия ленты не получает ETag свежей."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        key = page_cache.get_cache_key(
+            RequestFactory().get(url), f'feed.{invalidation.index_feed()}',
+            'GET', cache=cache)
+        cache.add(page_cache.LOCK_PREFIX + key, 1)
+        Post.objects.create(author=self.user, text='Ещё пост')
+        response = self.client.get(url)
+        self.assertNotContains(response, 'Ещё пост')
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        cache.delete(page_cache.LOCK_PREFIX + key)
+
+    def test_post_not_modified_until_comment(self):
+        """Страница поста отдаёт 304, пока к нему не добавят комментарий."""
+        self.assertNotModifiedUntil(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            lambda: Comment.objects.create(
+                post=self.post, author=self.user, text='Комментарий'),
+        )
+
+    def test_etag_depends_on_viewer(self):
+        """Гость и вошедший пользователь получают разные ETag."""
+        url = reverse('posts:profile', kwargs={'username': 'NoName'})
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    small_gif = (
+        b'\x47\x49\x46\x38\x39\x61\x02\x00'
+        b'\x01\x00\x80\x00\x00\x00\x00\x00'
+        b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+        b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+        b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+        b'\x0A\x00\x3B'
+    )
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def create_post(self):
+        return Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', self.small_gif, 'image/gif'),
+        )
+
+    def test_placeholder_until_generated(self):
+        """Пока пул не построил копии картинки, в карточке заглушка."""
+        self.create_post()
+        response = Client().get(reverse('posts:index'))
+        self.assertContains(response, 'aspect-ratio')
+        self.assertNotContains(response, '<img class="card-img')
+
+    @override_settings(THUMBNAIL_ASYNC=False)
+    def test_generated_on_upload(self):
+        """Готовые копии выводятся в srcset с адресами по хэшу."""
+        post = self.create_post()
+        renditions = thumbnails.lookup(post.image.name)
+        self.assertEqual(
+            [rendition.width for rendition in renditions
+             if rendition.format == 'JPEG'],
+            [min(settings.POST_RENDITION_WIDTHS)],
+        )
+        response = Client().get(reverse('posts:index'))
+        self.assertContains(response, '<img class="card-img')
+        self.assertContains(response, f'{renditions[0].url} 320w')
+        self.assertRegex(
+            renditions[0].file, r'^renditions/\w\w/\w{64}\.jpg$')
+
+    def test_missing_renditions_are_not_cached(self):
+        """Копии видны сразу после фиксации, без сброса кэша."""
+        name = self.create_post().image.name
+        self.assertEqual(thumbnails.lookup(name), [])
+        Rendition.objects.create(image=name, width=320, height=113,
+                                 format='JPEG', file='renditions/x.jpg')
+        self.assertEqual(len(thumbnails.lookup(name)), 1)
+        with self.assertNumQueries(0):
+            thumbnails.lookup(name)
+
+    @override_settings(THUMBNAIL_ASYNC=False)
+    def test_identical_uploads_share_file(self):
+        """Одинаковые загрузки хранятся один раз до последней ссылки."""
+        first, second = self.create_post(), self.create_post()
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 2)
+        storage = first.image.storage
+        first.delete()
+        self.assertFalse(blobs.collect(name))
+        self.assertTrue(storage.exists(name))
+        second.delete()
+        self.assertTrue(blobs.collect(name))
+        self.assertFalse(storage.exists(name))
+        self.assertEqual(thumbnails.lookup(name), [])
+
+    def test_identical_saves_race(self):
+        """Запись под занятое имя не портит файл и не оставляет мусора."""
+        storage = Post._meta.get_field('image').storage
+        name = storage.content_name('posts/x.gif', ContentFile(self.small_gif))
+        # Обе загрузки прошли проверку exists() до записи.
+        for _ in range(2):
+            self.assertEqual(
+                storage._save(name, ContentFile(self.small_gif)), name)
+        with storage.open(name) as stream:
+            self.assertEqual(stream.read(), self.small_gif)
+        self.assertEqual(os.listdir(os.path.dirname(storage.path(name))),
+                         [os.path.basename(name)])
+
+    def test_dedupe_media_command(self):
+        """Команда переносит старые файлы в хранилище по хэшу."""
+        storage = Post._meta.get_field('image').storage
+        for name in ('posts/a.gif', 'posts/b.gif'):
+            FileSystemStorage.save(
+                storage, name, ContentFile(self.small_gif))
+            Post.objects.create(author=self.user, text='Пост', image=name)
+        call_command('dedupe_media', stdout=StringIO())
+        names = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(storage.is_content_addressed(name))
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 2)
+        self.assertFalse(storage.exists('posts/a.gif'))
+        self.assertFalse(storage.exists('posts/b.gif'))
+
+    @override_settings(THUMBNAIL_ASYNC=False)
+    def test_page_thumbnails_resolved_in_one_query(self):
+        """Копии картинок всех карточек страницы ищутся одним запросом."""
+        posts = [self.create_post() for _ in range(3)]
+        cache.clear()
+        posts = list(Post.objects.filter(pk__in=[post.pk for post in posts]))
+        with self.assertNumQueries(1):
+            thumbnails.prefetch(posts)
+        with self.assertNumQueries(0):
+            thumbnails.prefetch(posts)
+        for post in posts:
+            self.assertTrue(post.renditions)
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        cls.cat = Post.objects.create(
+            author=cls.user, text='Кошки спят на тёплом подоконнике')
+        cls.dog = Post.objects.create(
+            author=cls.user, text='Собаки гуляют во дворе')
+
+    def setUp(self):
+        cache.clear()
+
+    def found(self, query, **params):
+        response = self.client.get(
+            reverse('posts:search'), {'q': query, **params})
+        return response, list(response.context['page_obj'])
+
+    def test_search_finds_by_prefix(self):
+        """Поиск находит посты по началу слова без учёта регистра."""
+        _, posts = self.found('КОШК')
+        self.assertEqual(posts, [self.cat])
+        _, posts = self.found('собак двор')
+        self.assertEqual(posts, [self.dog])
+
+    def test_empty_query_shows_only_form(self):
+        response = self.client.get(reverse('posts:search'), {'q': '  *'})
+        self.assertIsNone(response.context['page_obj'])
+
+    def test_index_follows_changes(self):
+        """Триггеры обновляют индекс при правке и удалении постов."""
+        Post.objects.filter(pk=self.cat.pk).update(text='Коты мурлычут')
+        self.assertEqual(self.found('кошки')[1], [])
+        self.assertEqual(self.found('мурлыч')[1], [self.cat])
+        Post.objects.filter(pk=self.dog.pk).delete()
+        self.assertEqual(self.found('собаки')[1], [])
+
+    def test_ranked_pages_keep_query(self):
+        """Курсор выдачи по оценке переходит на следующую страницу."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Кошки и кошки {i}')
+            for i in range(settings.POSTS_ON_PAGE))
+        response, first = self.found('кошки')
+        self.assertEqual(len(first), settings.POSTS_ON_PAGE)
+        page_obj = response.context['page_obj']
+        self.assertContains(
+            response, '?q=%D0%BA%D0%BE%D1%88%D0%BA%D0%B8&amp;after=')
+        _, second = self.found('кошки', after=page_obj.paginator.next_cursor)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(set(first) & set(second))
+        ranks = [post.rank for post in first + second]
+        self.assertEqual(ranks, sorted(ranks))
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'подокон'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.cat])
+
+    def test_rebuild_command(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(
+            set(Post.objects.filter(pk__in=search.post_ids('гуляют'))),
+            {self.dog})
+
+
+@override_settings(COMMENTS_ON_PAGE=3)
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+        cls.comments = [
+            Comment.objects.create(
+                post=cls.post, author=cls.user, text=f'коммент {i}')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def texts(self, response):
+        return [comment.text for comment in response.context['comments']]
+
+    def test_first_portion_is_capped(self):
+        """Страница поста выводит только первую порцию, новые сверху."""
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            response = self.client.get(reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.pk}))
+        self.assertEqual(
+            self.texts(response), ['коммент 4', 'коммент 3', 'коммент 2'])
+        self.assertContains(response, 'Показать ещё')
+
+    def test_load_more_continues_after_cursor(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.client.get(url, {'order': 'oldest'})
+        self.assertEqual(
+            self.texts(response), ['коммент 0', 'коммент 1', 'коммент 2'])
+        cursor = response.context['comments'].paginator.next_cursor
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'order': 'oldest', 'after': cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(self.texts(response), ['коммент 3', 'коммент 4'])
+        self.assertNotContains(response, 'Показать ещё')
+
+    def test_comments_of_missing_post(self):
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0}))
+        self.assertEqual(response.status_code, 404)
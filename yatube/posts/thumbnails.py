@@ -0,0 +1,195 @@
+"""Фоновая генерация адаптивных копий картинок постов.
+
+Картинка поста режется по пропорциям POST_RENDITION_RATIO в ширины из
+POST_RENDITION_WIDTHS (не больше ширины оригинала) в JPEG и в форматы
+из POST_IMAGE_VARIANTS, которые умеет записывать Pillow. Файл копии
+называется по хэшу своего содержимого, поэтому его адрес никогда не
+меняет смысл и раздаётся с Cache-Control: immutable, а одинаковые
+копии хранятся один раз. Список копий картинки хранится в таблице
+Rendition и кэшируется; отсутствие копий не кэшируется, чтобы
+карточка не застряла на заглушке.
+
+Копии строятся в пуле процессов после загрузки картинки; шаблоны
+через тег post_image выводят их в srcset и до их появления показывают
+заглушку. Когда копии готовы, версии постов с этой картинкой растут,
+а их ленты сбрасываются, чтобы кэшированные карточки обновились.
+"""
+import hashlib
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from core import metrics
+from . import fragments, images, invalidation
+from .models import Post, Rendition
+
+LOCK_PREFIX = 'thumbnail:'
+RENDITIONS_PREFIX = 'renditions:'
+RENDITIONS_DIR = 'renditions'
+EXTENSIONS = {'JPEG': 'jpg'}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def content_name(data, image_format):
+    digest = hashlib.sha256(data).hexdigest()
+    extension = EXTENSIONS.get(image_format, image_format.lower())
+    return f'{RENDITIONS_DIR}/{digest[:2]}/{digest}.{extension}'
+
+
+def widths(source_width):
+    """Ширины копий: не шире оригинала, но хотя бы одна."""
+    allowed = [width for width in settings.POST_RENDITION_WIDTHS
+               if width <= source_width]
+    return allowed or [min(settings.POST_RENDITION_WIDTHS)]
+
+
+def render(image, width, image_format):
+    ratio_width, ratio_height = settings.POST_RENDITION_RATIO
+    height = round(width * ratio_height / ratio_width)
+    resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    if image_format == 'JPEG' and resized.mode != 'RGB':
+        resized = resized.convert('RGB')
+    buffer = BytesIO()
+    resized.save(buffer, image_format, quality=settings.POST_IMAGE_QUALITY)
+    return buffer.getvalue(), height
+
+
+def build_renditions(name):
+    formats = ['JPEG', *images.writable_formats()]
+    renditions = []
+    with images.storage().open(name) as original, \
+            Image.open(original) as image:
+        image = ImageOps.exif_transpose(image)
+        for width in widths(image.width):
+            for image_format in formats:
+                data, height = render(image, width, image_format)
+                path = content_name(data, image_format)
+                if not default_storage.exists(path):
+                    default_storage.save(path, ContentFile(data))
+                renditions.append(Rendition(
+                    image=name, width=width, height=height,
+                    format=image_format, file=path,
+                ))
+    with transaction.atomic():
+        Rendition.objects.filter(image=name).delete()
+        Rendition.objects.bulk_create(renditions)
+    cache.delete(RENDITIONS_PREFIX + name)
+    transaction.on_commit(lambda: cache_renditions(name))
+    return renditions
+
+
+def cache_renditions(name):
+    cache.set(RENDITIONS_PREFIX + name,
+              list(Rendition.objects.filter(image=name)),
+              settings.POST_RENDITION_CACHE_TIME)
+
+
+def lookup_many(names):
+    """Копии нескольких картинок: {имя: [Rendition, ...]}.
+
+    Одним get_many и не больше чем одним запросом к БД. Пустой список
+    не кэшируется: читатель, заставший БД до фиксации копий, иначе
+    записал бы его в кэш уже после того, как generate() его очистил.
+    """
+    keys = {RENDITIONS_PREFIX + name: name for name in names}
+    found = cache.get_many(keys)
+    missing = {keys[key]: [] for key in keys if key not in found}
+    if missing:
+        for rendition in Rendition.objects.filter(image__in=missing):
+            missing[rendition.image].append(rendition)
+        cache.set_many(
+            {RENDITIONS_PREFIX + name: renditions
+             for name, renditions in missing.items() if renditions},
+            settings.POST_RENDITION_CACHE_TIME,
+        )
+    result = {keys[key]: renditions for key, renditions in found.items()}
+    result.update(missing)
+    return result
+
+
+def lookup(name):
+    return lookup_many([name])[name]
+
+
+def prefetch(posts):
+    """Кладёт в post.renditions копии картинок постов.
+
+    Тег post_image берёт их оттуда, и карточки страницы не ищут
+    копии каждая по отдельности.
+    """
+    posts = [post for post in posts if post.image]
+    if not posts:
+        return
+    found = lookup_many({post.image.name for post in posts})
+    for post in posts:
+        post.renditions = found[post.image.name]
+
+
+def generate(name):
+    """Строит копии и варианты картинки и обновляет карточки."""
+    started = time.perf_counter()
+    try:
+        build_renditions(name)
+        images.save_variants(name)
+    finally:
+        cache.delete(LOCK_PREFIX + name)
+    metrics.observe('yatube_thumbnail_duration_seconds',
+                    time.perf_counter() - started)
+    # Воркер пула живёт долго и может не дождаться следующей записи.
+    metrics.flush()
+    posts = Post.objects.filter(image=name).select_related('author')
+    fragments.bump_versions(posts)
+    for post in posts:
+        invalidation.post_changed(post, post.group_id)
+    return name
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        # spawn, а не fork: воркер веб-сервера многопоточный, и
+        # копировать его соединения с БД в дочерние процессы нельзя.
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+    return _executor
+
+
+def submit(name):
+    if not cache.add(LOCK_PREFIX + name, 1, settings.THUMBNAIL_LOCK_TIMEOUT):
+        return
+    try:
+        future = executor().submit(generate, name)
+    except Exception:
+        cache.delete(LOCK_PREFIX + name)
+        raise
+    future.add_done_callback(log_failure)
+
+
+def log_failure(future):
+    if future.exception() is not None:
+        logger.error('Не удалось построить копии картинки',
+                     exc_info=future.exception())
+
+
+def schedule(name):
+    """Ставит генерацию копий в очередь после фиксации транзакции."""
+    if not settings.THUMBNAIL_ASYNC:
+        generate(name)
+        return
+    transaction.on_commit(lambda: submit(name))
@@ -1,8 +1,207 @@
 from django.core.paginator import Paginator
 from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
+CURSOR_SEPARATOR = '|'
+KEYSET_FIELDS = ('pub_date', 'pk')
+COMMENT_KEYSET_FIELDS = ('created', 'pk')
+COMMENT_ORDERS = ('newest', 'oldest')
 
-def paginate_func(request, posts):
-    paginator = Paginator(posts, settings.POSTS_ON_PAGE)
+
+def encode_cursor(date, pk):
+    """Упаковывает ключ сортировки (дата, id) в непрозрачный токен."""
+    raw = f'{date.isoformat()}{CURSOR_SEPARATOR}{pk}'
+    return urlsafe_base64_encode(force_bytes(raw))
+
+
+def decode_cursor(token):
+    """Распаковывает токен в (дата, id); для битого токена вернёт None."""
+    if not token:
+        return None
+    try:
+        date, pk = force_str(
+            urlsafe_base64_decode(token)).split(CURSOR_SEPARATOR)
+        date, pk = parse_datetime(date), int(pk)
+    except ValueError:
+        return None
+    if date is None:
+        return None
+    return date, pk
+
+
+class KeysetPaginator(Paginator):
+    """Курсорный пагинатор по ключу (дата, id).
+
+    Вместо COUNT(*) и OFFSET выбирает записи строго старше (after)
+    или строго новее (before) границы из токена, поэтому любая
+    страница стоит столько же, сколько первая. Возвращает обычный
+    Page, совместимый с includes/paginator.html.
+    """
+    is_keyset = True
+    decode = staticmethod(decode_cursor)
+
+    def __init__(self, object_list, per_page, fields=KEYSET_FIELDS,
+                 after=None, before=None, descending=True):
+        super().__init__(object_list, per_page)
+        self.fields = fields
+        self.descending = descending
+        self.after = self.decode(after)
+        self.before = None if self.after else self.decode(before)
+        self.next_cursor = None
+        self.previous_cursor = None
+        self._num_pages = 1
+
+    @property
+    def num_pages(self):
+        return self._num_pages
+
+    def cursor(self, obj):
+        date_field, pk_field = self.fields
+        return encode_cursor(getattr(obj, date_field),
+                             getattr(obj, pk_field))
+
+    def boundary(self, cursor, forward, fields=None):
+        """Условие «строго за границей курсора» в порядке выдачи."""
+        date_field, pk_field = fields or self.fields
+        date, pk = cursor
+        lookup = 'lt' if forward == self.descending else 'gt'
+        return (Q(**{f'{date_field}__{lookup}': date})
+                | Q(**{date_field: date, f'{pk_field}__{lookup}': pk}))
+
+    def ordering(self, reverse=False, fields=None):
+        sign = '-' if self.descending != reverse else ''
+        return [f'{sign}{field}' for field in fields or self.fields]
+
+    def fetch_from(self, queryset, fields, cursor, forward, limit):
+        """До limit записей за границей курсора в порядке обхода."""
+        if cursor:
+            queryset = queryset.filter(
+                self.boundary(cursor, forward, fields))
+        ordering = self.ordering(reverse=not forward, fields=fields)
+        return list(queryset.order_by(*ordering)[:limit])
+
+    def fetch(self, cursor, forward, limit):
+        return self.fetch_from(
+            self.object_list, self.fields, cursor, forward, limit)
+
+    def page(self, number=None):
+        return self.get_page(number)
+
+    def get_page(self, number=None):
+        forward = self.before is None
+        items = self.fetch(
+            self.after if forward else self.before,
+            forward=forward,
+            limit=self.per_page + 1,
+        )
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if self.before:
+            if not items:
+                # Позади границы ничего нет — показываем первую страницу.
+                self.before = None
+                return self.get_page()
+            items.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = self.after is not None, has_more
+        if items and has_previous:
+            self.previous_cursor = self.cursor(items[0])
+        if items and has_next:
+            self.next_cursor = self.cursor(items[-1])
+        number = 2 if has_previous else 1
+        self._num_pages = number + 1 if has_next else number
+        return self._get_page(items, number, self)
+
+
+def paginate_func(request, posts, fields=KEYSET_FIELDS):
+    """Постраничный вывод: курсорный, нумерованный только по ?page=."""
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    if page_number is not None:
+        paginator = Paginator(posts, settings.POSTS_ON_PAGE)
+        return paginator.get_page(page_number)
+    paginator = KeysetPaginator(
+        posts,
+        settings.POSTS_ON_PAGE,
+        fields=fields,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    return paginator.get_page()
+
+
+def comment_order(request):
+    order = request.GET.get('order')
+    return order if order in COMMENT_ORDERS else COMMENT_ORDERS[0]
+
+
+def comment_ordering(order):
+    sign = '-' if order == 'newest' else ''
+    return [f'{sign}{field}' for field in COMMENT_KEYSET_FIELDS]
+
+
+def paginate_comments(request, comments, order):
+    """Порция комментариев за курсором ?after= в порядке order.
+
+    Догрузка идёт только вперёд, а порция не больше COMMENTS_ON_PAGE,
+    сколько бы комментариев ни было у поста.
+    """
+    paginator = KeysetPaginator(
+        comments.order_by(*comment_ordering(order)),
+        settings.COMMENTS_ON_PAGE,
+        fields=COMMENT_KEYSET_FIELDS,
+        after=request.GET.get('after'),
+        descending=order == 'newest',
+    )
+    return paginator.get_page()
+
+
+def estimate_count(model, using='default'):
+    """Число строк таблицы по статистике планировщика или None.
+
+    PostgreSQL хранит его в pg_class.reltuples, SQLite — в
+    sqlite_stat1 после ANALYZE. Чтение статистики не сканирует
+    таблицу, в отличие от COUNT(*).
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+    elif connection.vendor == 'sqlite':
+        sql = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1'
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        # В SQLite таблицы sqlite_stat1 нет, пока не было ANALYZE.
+        return None
+    if row is None:
+        return None
+    count = int(str(row[0]).split()[0])
+    return count if count >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки без точного COUNT(*) по большим таблицам.
+
+    Для всей таблицы берёт оценку из статистики, если она не меньше
+    ADMIN_EXACT_COUNT_LIMIT, а отфильтрованные выборки считает не
+    дальше этого предела: COUNT по подзапросу с LIMIT.
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        if not queryset.query.where:
+            estimate = estimate_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= limit:
+                return estimate
+        return queryset.order_by()[:limit].count()
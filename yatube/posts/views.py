@@ -1,29 +1,43 @@
+from django.http import Http404
 from django.shortcuts import redirect, render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
-
-from .models import Follow, Group, Post, User
-from .forms import PostForm, CommentForm
-from .utils import paginate_func
+from django.db import transaction
+from django.conf import settings
+from django.utils.http import urlencode
+from django.views.decorators.http import condition
 
+from core.cache import cache_versioned
+from core.query_budget import query_budget
 
-CACHE_TIME = 20
+from . import etags, feed, fragments, invalidation, search
+from .models import Comment, Follow, Group, Post, User
+from .forms import PostForm, CommentForm
+from .utils import comment_order, paginate_comments, paginate_func
 
 
-@cache_page(CACHE_TIME, key_prefix='index_page')
+@condition(etag_func=etags.index)
+@cache_versioned(
+    settings.FEED_CACHE_TIME, invalidation.index_feed, etag=etags.served)
+@query_budget(4)
 def index(request):
-    posts = Post.objects.all()
+    posts = Post.objects.select_related('author', 'group')
     page_obj = paginate_func(request, posts)
+    fragments.attach_fragments(page_obj)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=etags.group_posts)
+@cache_versioned(
+    settings.FEED_CACHE_TIME, invalidation.group_feed, etag=etags.served)
+@query_budget(5)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    posts = group.posts.select_related('author')
     page_obj = paginate_func(request, posts)
+    fragments.attach_fragments(page_obj)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -31,10 +45,16 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@condition(etag_func=etags.profile)
+@cache_versioned(
+    settings.FEED_CACHE_TIME, invalidation.profile_feed, etag=etags.served)
+@query_budget(6)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    posts = author.posts.select_related('group')
     page_obj = paginate_func(request, posts)
+    fragments.attach_fragments(page_obj)
     following = request.user.is_authenticated and (
         Follow.objects.filter(user=request.user,
                               author=author
@@ -47,19 +67,46 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@condition(etag_func=etags.post_detail)
+@query_budget(6)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id)
+    order = comment_order(request)
+    comments = paginate_comments(
+        request, post.comments.select_related('author'), order)
     form = CommentForm()
     context = {
         'post': post,
         'form': form,
         'comments': comments,
+        'comments_order': order,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@condition(etag_func=etags.post_detail)
+@query_budget(2)
+def post_comments(request, post_id):
+    """Следующая порция комментариев для кнопки «Показать ещё»."""
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    order = comment_order(request)
+    comments = paginate_comments(
+        request,
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        order,
+    )
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+        'comments_order': order,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None,
                     files=request.FILES or None)
@@ -72,6 +119,7 @@ def post_create(request):
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if post.author != request.user:
@@ -90,6 +138,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -102,14 +151,31 @@ def add_comment(request, post_id):
 
 
 @login_required
+@query_budget(5)
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginate_func(request, posts)
+    page_obj = feed.get_page(request, request.user)
+    fragments.attach_fragments(page_obj)
     context = {'page_obj': page_obj}
     return render(request, 'posts/follow.html', context)
 
 
+@query_budget(5)
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if search.build_query(query):
+        page_obj = search.get_page(request, query)
+        fragments.attach_fragments(page_obj)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     if request.user.get_username() != username:
         author = get_object_or_404(User, username=username)
@@ -121,6 +187,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     if request.user.get_username() != username:
         author = get_object_or_404(User, username=username)
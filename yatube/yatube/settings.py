@@ -46,18 +46,19 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'sorl.thumbnail',
-    'debug_toolbar',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.request_metrics.RequestMetricsMiddleware',
+    'core.slow_queries.SlowQueryMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -143,6 +144,59 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 POSTS_ON_PAGE = 10
 
+# Комментариев в первой порции страницы поста и в каждой догрузке.
+COMMENTS_ON_PAGE = 20
+
+FEED_CACHE_TIME = 6 * 60 * 60
+
+CACHE_STALE_TIME = 10 * 60
+
+CACHE_LOCK_TIMEOUT = 30
+
+CACHE_WAIT_TIMEOUT = 2
+
+CACHE_XFETCH_BETA = 1.0
+
+POST_FRAGMENT_CACHE_TIME = 24 * 60 * 60
+
+# Адаптивные копии картинок постов: ширины, пропорции и атрибут sizes.
+POST_RENDITION_WIDTHS = (320, 640, 960, 1920)
+
+POST_RENDITION_RATIO = (960, 339)
+
+POST_RENDITION_DEFAULT_WIDTH = 960
+
+POST_RENDITION_CACHE_TIME = 24 * 60 * 60
+
+POST_IMAGE_SIZES = '(min-width: 992px) 960px, 100vw'
+
+THUMBNAIL_ASYNC = True
+
+POST_IMAGE_MAX_BYTES = 25 * 1024 * 1024
+
+POST_IMAGE_MAX_PIXELS = 50 * 10 ** 6
+
+POST_IMAGE_MAX_SIDE = 2560
+
+POST_IMAGE_QUALITY = 85
+
+POST_IMAGE_VARIANTS = ('WEBP', 'AVIF')
+
+THUMBNAIL_WORKERS = 2
+
+THUMBNAIL_LOCK_TIMEOUT = 600
+
+# С этого числа подписчиков посты автора читаются при выдаче ленты;
+# состав «звёзд» пересчитывает команда reclassify_celebrities (cron).
+FEED_CELEBRITY_THRESHOLD = 10000
+
+FEED_CELEBRITY_CACHE_TIME = 600
+
+SEARCH_MAX_WORDS = 10
+
+# Дальше этого числа строк админка не считает записи точно.
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
@@ -150,10 +204,33 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'L1_TIMEOUT': 1,
+            'L1_BYPASS': ('generation:', 'lock:', 'feed:'),
+        },
     }
 }
 
-INTERNAL_IPS = [
-    '127.0.0.1',
-]
+PROFILING_ENABLED = True
+# Доля запросов, выполняемых под cProfile.
+PROFILING_SAMPLE_RATE = 0.01
+PROFILING_SAMPLES = 20
+PROFILING_STACK_LIMIT = 30
+# Сколько последних запросов представления берётся для p50 и p95.
+PROFILING_WINDOW = 1000
+PROFILING_SLOW_MS = 500
+# Запросы к БД не короче этого попадают в журнал медленных запросов;
+# None отключает журнал. От PROFILING_ENABLED журнал не зависит.
+SLOW_QUERY_MS = 100
+
+# Общий файл метрик всех процессов; None — у каждого процесса свои.
+METRICS_DB = os.path.join(BASE_DIR, 'metrics.sqlite3')
+METRICS_FLUSH_INTERVAL = 1
+# Bearer-токен Prometheus для /metrics; без него метрики видит только персонал.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Тесты держат кэш и метрики во временном каталоге (core.testing).
+TEST_RUNNER = 'core.testing.IsolatedDataRunner'
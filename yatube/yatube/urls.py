@@ -1,10 +1,18 @@
+import os
+
 from django.contrib import admin
 from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
+from django.views.decorators.cache import cache_control
+from django.views.static import serve
+
+from core.views import profiling_stats, prometheus_metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('profiling/', profiling_stats, name='profiling'),
+    path('metrics', prometheus_metrics, name='metrics'),
     path('', include('posts.urls', namespace='posts')),
     path('auth/', include('users.urls')),
     path('about/', include('about.urls', namespace='about')),
@@ -16,11 +24,17 @@ handler500 = 'core.views.server_error'
 handler403 = 'core.views.permission_denied'
 
 if settings.DEBUG:
+    # Копии картинок названы по хэшу содержимого и не меняются; в
+    # боевой конфигурации те же заголовки должен ставить веб-сервер.
+    urlpatterns += [
+        path(
+            f'{settings.MEDIA_URL.strip("/")}/renditions/<path:path>',
+            cache_control(public=True, max_age=365 * 24 * 60 * 60,
+                          immutable=True)(serve),
+            {'document_root': os.path.join(
+                settings.MEDIA_ROOT, 'renditions')},
+        ),
+    ]
     urlpatterns += static(
         settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
     )
-
-if settings.DEBUG:
-    import debug_toolbar
-
-    urlpatterns += (path('__debug__/', include(debug_toolbar.urls)),)